@@ -0,0 +1,32 @@
+import logging
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# The loggers LOGGING sets up, quietened to TEST_LOG_LEVEL during tests
+QUIET_LOGGERS = ("celery", "loans")
+
+
+class TestRunner(DiscoverRunner):
+    """
+    DiscoverRunner on the per-process LOCAL_CACHES instead of Redis, with the
+    loans and celery loggers at TEST_LOG_LEVEL so INFO events from the code
+    under test do not flood the output.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.local_caches = override_settings(CACHES=settings.LOCAL_CACHES)
+        self.local_caches.enable()
+        self.log_levels = {}
+        for name in QUIET_LOGGERS:
+            logger = logging.getLogger(name)
+            self.log_levels[name] = logger.level
+            logger.setLevel(settings.TEST_LOG_LEVEL)
+
+    def teardown_test_environment(self, **kwargs):
+        for name, level in self.log_levels.items():
+            logging.getLogger(name).setLevel(level)
+        self.local_caches.disable()
+        super().teardown_test_environment(**kwargs)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class LoansConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "loans"
+
+    def ready(self):
+        # Connects the balances_changed receiver that queues score refreshes
+        from . import tasks  # noqa: F401
@@ -0,0 +1,155 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import status
+
+from .cashflow import aget_cached_cashflow, portfolio_cashflow
+from .idempotency import idempotent
+from .models import LoanApplication
+from .serializers import PaymentSerializer, StatementQuerySerializer, UserSerializer
+from .statements import (
+    acache_statement,
+    aget_cached_statement,
+    astream_statement,
+    statement_page,
+)
+from .tasks import calculate_credit_score
+
+
+class AsyncAPIView(View):
+    """
+    Base for the async variants of the API views, served under /api/async/
+    with the same request and response bodies. DRF's APIView only runs sync
+    handlers, so these are plain Django views: request.data is the parsed
+    JSON body and responses are JsonResponse.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Like APIView, these JSON endpoints do not use CSRF cookies
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.data = json.loads(request.body or b"{}")
+        except ValueError as error:
+            return JsonResponse(
+                {"detail": f"JSON parse error - {error}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return await super().dispatch(request, *args, **kwargs)
+
+
+async def enqueue(task, *args):
+    # Publishing to the broker is blocking I/O; it runs in the thread pool
+    # rather than on the event loop or the thread that serves the ORM.
+    return await sync_to_async(task.delay, thread_sensitive=False)(*args)
+
+
+@sync_to_async
+def save_valid(serializer):
+    # Validation queries the database too, so both run in one hop to the
+    # ORM's thread. Returns None when the data is invalid.
+    return serializer.save() if serializer.is_valid() else None
+
+
+class RegisterUser(AsyncAPIView):
+    async def post(self, request):
+        serializer = UserSerializer(data=request.data)
+        user = await save_valid(serializer)
+        if user is None:
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        await enqueue(calculate_credit_score, user.aadhar_id)
+        return JsonResponse(
+            {"unique_user_id": user.unique_user_id}, status=status.HTTP_200_OK
+        )
+
+
+@sync_to_async
+def create_payment(data):
+    # Validation locks the loan row inside the transaction, so the whole
+    # payment is one call on the ORM's thread.
+    serializer = PaymentSerializer(data=data)
+    try:
+        with transaction.atomic():
+            if serializer.is_valid():
+                serializer.save()
+                return {"status": "Payment registered successfully"}, status.HTTP_200_OK
+    except IntegrityError:
+        return (
+            {
+                "non_field_errors": [
+                    "A payment for this loan on this date already exists"
+                ]
+            },
+            status.HTTP_400_BAD_REQUEST,
+        )
+    return serializer.errors, status.HTTP_400_BAD_REQUEST
+
+
+class MakePayment(AsyncAPIView):
+    @idempotent
+    async def post(self, request):
+        body, status_code = await create_payment(request.data)
+        return JsonResponse(body, status=status_code)
+
+
+class GetStatement(AsyncAPIView):
+    async def get(self, request, loan_id):
+        query = StatementQuerySerializer(data=request.GET)
+        if not query.is_valid():
+            return JsonResponse(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+
+        statement = None
+        if not params:
+            statement = await aget_cached_statement(loan_id)
+        if statement is None:
+            try:
+                loan = await LoanApplication.objects.aget(loan_id=loan_id)
+            except LoanApplication.DoesNotExist:
+                return JsonResponse(
+                    {"error": "Loan does not exist"}, status=status.HTTP_400_BAD_REQUEST
+                )
+            if loan.is_closed:
+                return JsonResponse(
+                    {"error": "Loan is closed"}, status=status.HTTP_400_BAD_REQUEST
+                )
+
+            if params.get("stream") == "ndjson":
+                return StreamingHttpResponse(
+                    astream_statement(loan), content_type="application/x-ndjson"
+                )
+            if params:
+                page = await sync_to_async(statement_page)(
+                    loan,
+                    params.get("limit", settings.STATEMENT_PAGE_SIZE),
+                    params.get("past_after"),
+                    params.get("upcoming_after"),
+                    params.get("section"),
+                )
+                return JsonResponse(page, status=status.HTTP_200_OK)
+
+            statement = await acache_statement(loan)
+
+        if_none_match = request.headers.get("If-None-Match", "")
+        if statement["etag"] in [etag.strip() for etag in if_none_match.split(",")]:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = JsonResponse(statement["body"], status=status.HTTP_200_OK)
+        response["ETag"] = statement["etag"]
+        return response
+
+
+class PortfolioCashflow(AsyncAPIView):
+    async def get(self, request):
+        projection = await aget_cached_cashflow()
+        if projection is None:
+            projection = await sync_to_async(portfolio_cashflow)()
+        return JsonResponse({"cashflow": projection}, status=status.HTTP_200_OK)
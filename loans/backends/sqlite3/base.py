@@ -0,0 +1,24 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite tuned for a single node serving concurrent writes. WAL lets reads
+    run alongside a write, synchronous=NORMAL syncs at checkpoints instead
+    of on every commit (still safe under WAL, a power loss can only drop the
+    last commits), and transactions start with BEGIN IMMEDIATE. A deferred
+    BEGIN that later writes fails at once with "database is locked" when
+    another connection holds the write lock; an immediate one waits for it
+    up to the connection's timeout (OPTIONS["timeout"], the busy timeout).
+    """
+
+    transaction_mode = "IMMEDIATE"
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f"BEGIN {self.transaction_mode}")
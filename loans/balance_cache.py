@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Sum
+
+from .models import TransactionFileBalance, UserBalance
+from .transaction_store import current_store
+from .transactions import ensure_balance_index, file_fingerprint, normalise_path
+
+logger = logging.getLogger(__name__)
+
+
+def appended_balances():
+    # Net balance per user of the ingested files other than TRANSACTIONS_FILE,
+    # which the store does not hold, as recorded when they were ingested
+    source = normalise_path(settings.TRANSACTIONS_FILE)
+    return dict(
+        TransactionFileBalance.objects.exclude(file__path=source)
+        .values("aadhar_id")
+        .annotate(total=Sum("balance"))
+        .values_list("aadhar_id", "total")
+        .iterator(chunk_size=10000)
+    )
+
+
+class BalanceCache:
+    """
+    Per-process copy of every user's net balance, keyed by the fingerprint of
+    TRANSACTIONS_FILE. Lookups are dictionary reads, or slices of the
+    memory-mapped store when one is built from the current file, which all
+    processes share instead of each holding a copy. The store holds only
+    TRANSACTIONS_FILE, so the balances of files appended with
+    ingest_transactions are added on top of it. The cache is reloaded when
+    the file changes, and after BALANCE_CACHE_MAX_AGE seconds so that newly
+    appended files show up.
+    """
+
+    def __init__(self):
+        self.fingerprint = None
+        self.loaded_at = 0
+        self.balances = {}
+        self.store = None
+        self.counters = Counter(hits=0, misses=0, loads=0, reloads=0)
+        self.lock = threading.Lock()
+
+    def is_fresh(self):
+        return (
+            self.fingerprint is not None
+            and time.monotonic() - self.loaded_at < settings.BALANCE_CACHE_MAX_AGE
+            and self.fingerprint == file_fingerprint(settings.TRANSACTIONS_FILE)
+        )
+
+    def load(self):
+        with self.lock:
+            if self.is_fresh():
+                return
+            # A cold cache is a load; replacing a loaded one is a reload
+            self.counters["loads" if self.fingerprint is None else "reloads"] += 1
+            fingerprint = file_fingerprint(settings.TRANSACTIONS_FILE)
+            store = current_store()
+            if store is not None:
+                balances = appended_balances()
+            else:
+                ensure_balance_index()
+                balances = dict(
+                    UserBalance.objects.values_list("aadhar_id", "balance").iterator(
+                        chunk_size=10000
+                    )
+                )
+            self.store, self.balances = store, balances
+            self.fingerprint = fingerprint
+            self.loaded_at = time.monotonic()
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Loaded worker balance cache", extra=self.stats())
+
+    def get(self, aadhar_id):
+        # Returns None when the user has no transactions at all.
+        return self.get_many([aadhar_id]).get(aadhar_id)
+
+    def get_many(self, aadhar_ids):
+        if not self.is_fresh():
+            self.load()
+        if self.store is not None:
+            balances = self.store.balances(aadhar_ids)
+            for aadhar_id in aadhar_ids:
+                if aadhar_id in self.balances:
+                    balances[aadhar_id] = (
+                        balances.get(aadhar_id, 0) + self.balances[aadhar_id]
+                    )
+        else:
+            balances = {
+                aadhar_id: self.balances[aadhar_id]
+                for aadhar_id in aadhar_ids
+                if aadhar_id in self.balances
+            }
+        # Users without any transactions are misses
+        self.counters["hits"] += len(balances)
+        self.counters["misses"] += len(aadhar_ids) - len(balances)
+        return balances
+
+    def stats(self):
+        users = len(self.balances)
+        if self.store is not None:
+            users = len(self.store.users) + sum(
+                1
+                for aadhar_id in self.balances
+                if self.store.user_rows(aadhar_id) is None
+            )
+        return {**self.counters, "users": users}
+
+
+balance_cache = BalanceCache()
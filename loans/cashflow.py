@@ -0,0 +1,200 @@
+import uuid
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+
+from .models import Installment, LoanApplication
+from .money import from_paise, monthly_rate, to_paise
+
+PORTFOLIO_CACHE_KEY = "cashflow:portfolio"
+PORTFOLIO_GENERATION_KEY = "cashflow-generation:portfolio"
+
+
+def chunk_cache_key(chunk):
+    return f"cashflow:chunk:{chunk}"
+
+
+def chunk_generation_key(chunk):
+    return f"cashflow-generation:{chunk}"
+
+
+def invalidate_cashflow(loan_pk):
+    # Give the loan's chunk and the portfolio new generations once the
+    # surrounding transaction commits. Projections are cached with the
+    # generation read before they were computed, so one computed before the
+    # commit and cached after it is never served. Only the chunk holding
+    # the loan is recomputed on the next read; the other chunks are summed
+    # from the cache.
+    chunk = loan_pk // settings.CASHFLOW_CHUNK_SIZE
+    generations = {
+        chunk_generation_key(chunk): uuid.uuid4().hex,
+        PORTFOLIO_GENERATION_KEY: uuid.uuid4().hex,
+    }
+    transaction.on_commit(lambda: cache.set_many(generations, None))
+
+
+def _current(entries, key, generation_key):
+    # The cached value if it was computed in the current generation
+    cached = entries.get(key)
+    if cached is None:
+        return None
+    generation, value = cached
+    if generation != entries.get(generation_key):
+        return None
+    return value
+
+
+def split_installments(
+    loan_index, amounts, balances, rate_numerators, rate_denominators
+):
+    """
+    Splits each installment into principal and interest by amortising the
+    loan's balance over its installments in due-date order. Installments are
+    given as columnar arrays sorted by loan and due date, with loan_index
+    pointing into the per-loan arrays. Returns the interest per installment,
+    in paise like the inputs.
+    """
+    count = len(amounts)
+    interest = np.zeros(count, dtype=amounts.dtype)
+    if not count:
+        return interest
+
+    # Position of each installment within its loan, then the installments
+    # grouped by position so every loan is stepped one month per pass
+    starts = np.flatnonzero(np.r_[True, loan_index[1:] != loan_index[:-1]])
+    position = np.arange(count) - np.repeat(starts, np.diff(np.r_[starts, count]))
+    order = np.argsort(position, kind="stable")
+    steps = np.split(order, np.flatnonzero(np.diff(position[order])) + 1)
+
+    balances = balances.copy()
+    for rows in steps:
+        loans = loan_index[rows]
+        # Same half-up rounding to the paisa as money.interest_paise
+        step_interest = (
+            2 * balances[loans] * rate_numerators[loans] + rate_denominators[loans]
+        ) // (2 * rate_denominators[loans])
+        interest[rows] = step_interest
+        balances[loans] -= amounts[rows] - step_interest
+    return interest
+
+
+def project_chunk(chunk):
+    """
+    Expected collections of the open loans in one primary key range, as
+    {(month, loan_type): [amount, principal, interest]} in paise.
+    """
+    size = settings.CASHFLOW_CHUNK_SIZE
+    loans = list(
+        LoanApplication.objects.filter(
+            id__gte=chunk * size, id__lt=(chunk + 1) * size, is_closed=False
+        )
+        .order_by("id")
+        .values_list(
+            "id",
+            "loan_type",
+            "interest_rate",
+            "loan_amount",
+            "statement__remaining_principal",
+        )
+    )
+    totals = defaultdict(lambda: [0, 0, 0])
+    if not loans:
+        return dict(totals)
+
+    positions = {loan[0]: index for index, loan in enumerate(loans)}
+    installments = list(
+        Installment.objects.filter(loan_id__in=positions, paid=False)
+        .order_by("loan_id", "due_date")
+        .values_list("loan_id", "due_date", "amount_due")
+    )
+    if not installments:
+        return dict(totals)
+
+    rates = [monthly_rate(loan[2]) for loan in loans]
+    balances = [to_paise(loan[4] if loan[4] is not None else loan[3]) for loan in loans]
+    amounts = [to_paise(amount_due) for _, _, amount_due in installments]
+
+    # int64 unless an unusual rate makes the interest products overflow it
+    largest = max(map(abs, balances + amounts)) * max(r.numerator for r in rates)
+    dtype = np.int64 if largest < 2**60 else object
+    loan_index = np.array([positions[row[0]] for row in installments])
+    amount_array = np.array(amounts, dtype=dtype)
+    interest = split_installments(
+        loan_index,
+        amount_array,
+        np.array(balances, dtype=dtype),
+        np.array([r.numerator for r in rates], dtype=dtype),
+        np.array([r.denominator for r in rates], dtype=dtype),
+    )
+
+    loan_types = [loan[1] for loan in loans]
+    for (_, due_date, _), index, amount, interest_for_month in zip(
+        installments, loan_index.tolist(), amounts, interest.tolist()
+    ):
+        row = totals[due_date.strftime("%Y-%m"), loan_types[index]]
+        row[0] += amount
+        row[1] += amount - interest_for_month
+        row[2] += interest_for_month
+    return dict(totals)
+
+
+def portfolio_cashflow():
+    """
+    Expected collections per month and loan type across all open loans,
+    aggregated from per-chunk projections that are cached separately.
+    """
+    entries = cache.get_many([PORTFOLIO_CACHE_KEY, PORTFOLIO_GENERATION_KEY])
+    projection = _current(entries, PORTFOLIO_CACHE_KEY, PORTFOLIO_GENERATION_KEY)
+    if projection is not None:
+        return projection
+
+    last_id = LoanApplication.objects.aggregate(last_id=Max("id"))["last_id"]
+    chunks = range(last_id // settings.CASHFLOW_CHUNK_SIZE + 1 if last_id else 0)
+    cached = cache.get_many(
+        [
+            key
+            for chunk in chunks
+            for key in (chunk_cache_key(chunk), chunk_generation_key(chunk))
+        ]
+    )
+
+    totals = defaultdict(lambda: [0, 0, 0])
+    for chunk in chunks:
+        key, generation_key = chunk_cache_key(chunk), chunk_generation_key(chunk)
+        chunk_totals = _current(cached, key, generation_key)
+        if chunk_totals is None:
+            chunk_totals = project_chunk(chunk)
+            cache.set(
+                key,
+                (cached.get(generation_key), chunk_totals),
+                settings.CASHFLOW_CACHE_TIMEOUT,
+            )
+        for group, values in chunk_totals.items():
+            for column, value in enumerate(values):
+                totals[group][column] += value
+
+    projection = [
+        {
+            "month": month,
+            "loan_type": loan_type,
+            "expected_amount": float(from_paise(amount)),
+            "principal": float(from_paise(principal)),
+            "interest": float(from_paise(interest)),
+        }
+        for (month, loan_type), (amount, principal, interest) in sorted(totals.items())
+    ]
+    cache.set(
+        PORTFOLIO_CACHE_KEY,
+        (entries.get(PORTFOLIO_GENERATION_KEY), projection),
+        settings.CASHFLOW_CACHE_TIMEOUT,
+    )
+    return projection
+
+
+async def aget_cached_cashflow():
+    entries = await cache.aget_many([PORTFOLIO_CACHE_KEY, PORTFOLIO_GENERATION_KEY])
+    return _current(entries, PORTFOLIO_CACHE_KEY, PORTFOLIO_GENERATION_KEY)
@@ -0,0 +1,136 @@
+import logging
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Exists, F, Min, OuterRef, Sum
+
+from .models import (
+    DelinquencyChunk,
+    DelinquencySnapshot,
+    Installment,
+    LoanApplication,
+)
+from .statements import invalidate_statements
+
+logger = logging.getLogger(__name__)
+
+# Upper bound in days past due of each bucket after "current"
+DPD_BUCKETS = ((30, "1-30"), (60, "31-60"), (90, "61-90"))
+
+
+def dpd_bucket(days_past_due):
+    if days_past_due <= 0:
+        return "current"
+    for limit, bucket in DPD_BUCKETS:
+        if days_past_due <= limit:
+            return bucket
+    return "90+"
+
+
+def open_loan_id_ranges(batch_size):
+    # Keyset pagination over open loans: each range is read from the primary
+    # key index after the last one, so the cost per chunk does not grow with
+    # how far into the portfolio it is.
+    last_id = 0
+    while True:
+        ids = list(
+            LoanApplication.objects.filter(is_closed=False, id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        yield ids[0], ids[-1]
+        last_id = ids[-1]
+
+
+def reset_snapshot(as_of):
+    # Zeroed rows for the day, which the chunks then add to. Rerunning the
+    # batch for a day starts it over.
+    with transaction.atomic():
+        DelinquencySnapshot.objects.filter(date=as_of).delete()
+        DelinquencyChunk.objects.filter(date=as_of).delete()
+        DelinquencySnapshot.objects.bulk_create(
+            [
+                DelinquencySnapshot(date=as_of, loan_type=loan_type, bucket=bucket)
+                for loan_type, _ in LoanApplication.LOAN_TYPES
+                for bucket in DelinquencySnapshot.BUCKETS
+            ]
+        )
+
+
+def process_loan_range(first_id, last_id, as_of):
+    """
+    Flags overdue installments, closes fully paid loans and adds the range's
+    open loans to the day's snapshot, for loans with first_id <= id <= last_id.
+    The range is recorded in the same transaction and a range already
+    recorded for the day is skipped, so a chunk delivered twice counts once.
+    """
+    loans = LoanApplication.objects.filter(
+        id__gte=first_id, id__lte=last_id, is_closed=False
+    )
+    unpaid = Installment.objects.filter(loan=OuterRef("pk"), paid=False)
+
+    with transaction.atomic():
+        _, created = DelinquencyChunk.objects.get_or_create(
+            date=as_of, first_id=first_id, defaults={"last_id": last_id}
+        )
+        if not created:
+            logger.info(
+                "Delinquency chunk already processed",
+                extra={"as_of": as_of, "first_id": first_id, "last_id": last_id},
+            )
+            return
+
+        Installment.objects.filter(
+            loan__in=loans, paid=False, overdue=False, due_date__lt=as_of
+        ).update(overdue=True)
+
+        paid_off = list(loans.exclude(Exists(unpaid)).values_list("pk", "loan_id"))
+        if paid_off:
+            LoanApplication.objects.filter(pk__in=[pk for pk, _ in paid_off]).update(
+                is_closed=True
+            )
+            # Closed loans have no statement; retire any cached one
+            invalidate_statements([loan_id for _, loan_id in paid_off])
+
+        # Loans closed above no longer match the filter
+        open_loans = Counter(loans.values_list("loan_type", flat=True))
+        overdue = (
+            Installment.objects.filter(loan__in=loans, paid=False, due_date__lt=as_of)
+            .values("loan_id", "loan__loan_type")
+            .annotate(oldest_due=Min("due_date"), amount=Sum("amount_due"))
+        )
+
+        counts = defaultdict(int)
+        amounts = defaultdict(Decimal)
+        for row in overdue:
+            key = (
+                row["loan__loan_type"],
+                dpd_bucket((as_of - row["oldest_due"]).days),
+            )
+            counts[key] += 1
+            amounts[key] += row["amount"]
+            open_loans[row["loan__loan_type"]] -= 1
+        for loan_type, count in open_loans.items():
+            counts[loan_type, "current"] += count
+
+        for (loan_type, bucket), count in counts.items():
+            if count:
+                DelinquencySnapshot.objects.filter(
+                    date=as_of, loan_type=loan_type, bucket=bucket
+                ).update(
+                    loan_count=F("loan_count") + count,
+                    overdue_amount=F("overdue_amount") + amounts[loan_type, bucket],
+                )
+
+    logger.info(
+        "Delinquency chunk processed",
+        extra={
+            "as_of": as_of,
+            "first_id": first_id,
+            "last_id": last_id,
+            "closed": len(paid_off),
+        },
+    )
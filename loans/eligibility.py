@@ -0,0 +1,101 @@
+import numpy as np
+
+from .money import to_paise
+from .utils import calculate_emi_schedules
+
+# Largest loan_amount per loan type, in rupees
+LOAN_LIMITS = {
+    "Car": 750000,
+    "Home": 8500000,
+    "Education": 5000000,
+    "Personal": 1000000,
+}
+MIN_CREDIT_SCORE = 450
+MIN_ANNUAL_INCOME = 150000
+MIN_INTEREST_RATE = 14
+# Longest term in months. The EMI factors are exact powers of the term, so
+# an unbounded term would let one request pin a worker.
+MAX_TERM_PERIOD = 480
+# Interest over the whole term must be above this, in rupees
+MIN_TOTAL_INTEREST = 10000
+
+UNKNOWN_USER = "User does not exist"
+INELIGIBLE_USER = "User does not meet the criteria for loan application"
+OVER_LIMIT = "Loan amount exceeds the limit for the selected loan type"
+LOW_INTEREST_RATE = "Interest rate should be >= 14%"
+EMI_OVER_INCOME = "EMI amount exceeds 60% of the user's monthly income"
+LOW_TOTAL_INTEREST = "Total interest earned should be > 10000"
+
+
+def evaluate_applications(applications, users):
+    """
+    Checks loan applications against the eligibility rules, each rule as one
+    array comparison over all of them. applications are validated
+    LoanApplicationSerializer data and users maps unique_user_id to User.
+    Returns (errors, schedules) with one entry per application: the message
+    of the first rule it fails or None, and (emi_amount, emi_dates) for
+    accepted applications or None.
+    """
+    count = len(applications)
+    errors = [None] * count
+    schedules = [None] * count
+    if not count:
+        return errors, schedules
+    pending = np.ones(count, dtype=bool)
+
+    def reject(failed, message):
+        failed &= pending
+        for index in np.flatnonzero(failed).tolist():
+            errors[index] = message
+        pending[failed] = False
+
+    found = [users.get(application["user"]) for application in applications]
+    reject(np.array([user is None for user in found]), UNKNOWN_USER)
+
+    # Amounts in paise, as int64 arrays; missing users count as zero
+    credit_scores = np.array([user.credit_score if user else 0 for user in found])
+    incomes = np.array(
+        [to_paise(user.annual_income) if user else 0 for user in found], dtype=np.int64
+    )
+    amounts = np.array(
+        [to_paise(application["loan_amount"]) for application in applications],
+        dtype=np.int64,
+    )
+    limits = np.array(
+        [LOAN_LIMITS.get(application["loan_type"], 0) for application in applications],
+        dtype=np.int64,
+    )
+    rates = np.array(
+        [float(application["interest_rate"]) for application in applications]
+    )
+    terms = np.array(
+        [application["term_period"] for application in applications], dtype=np.int64
+    )
+
+    reject(
+        (credit_scores < MIN_CREDIT_SCORE) | (incomes < MIN_ANNUAL_INCOME * 100),
+        INELIGIBLE_USER,
+    )
+    reject(amounts > limits * 100, OVER_LIMIT)
+    reject(rates < MIN_INTEREST_RATE, LOW_INTEREST_RATE)
+
+    # Schedules only for applications that passed so far
+    remaining = np.flatnonzero(pending).tolist()
+    computed = calculate_emi_schedules(
+        [applications[index]["loan_amount"] for index in remaining],
+        [applications[index]["interest_rate"] for index in remaining],
+        [applications[index]["term_period"] for index in remaining],
+        [applications[index]["disbursement_date"] for index in remaining],
+    )
+    emis = np.zeros(count, dtype=np.int64)
+    for index, schedule in zip(remaining, computed):
+        schedules[index] = schedule
+        emis[index] = to_paise(schedule[0])
+
+    # At most 60% of the monthly income, as in money.max_emi_paise
+    reject(emis > incomes * 6 // 120, EMI_OVER_INCOME)
+    reject(emis * terms - amounts <= MIN_TOTAL_INTEREST * 100, LOW_TOTAL_INTEREST)
+
+    for index in np.flatnonzero(~pending).tolist():
+        schedules[index] = None
+    return errors, schedules
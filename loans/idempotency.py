@@ -0,0 +1,140 @@
+import asyncio
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.response import Response
+
+IN_PROGRESS = "in-progress"
+
+
+def _fingerprint(request):
+    return hashlib.md5(
+        json.dumps(request.data, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def _replay(stored, fingerprint):
+    # (data, status, replayed) for a request whose key is already taken
+    if stored["fingerprint"] != fingerprint:
+        return (
+            {"error": "Idempotency-Key was used for a different request"},
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            False,
+        )
+    if stored["state"] == IN_PROGRESS:
+        return (
+            {"error": "A request with this Idempotency-Key is in progress"},
+            status.HTTP_409_CONFLICT,
+            False,
+        )
+    return stored["data"], stored["status"], True
+
+
+def idempotent(view_method):
+    """
+    Lets clients retry a POST safely by sending an Idempotency-Key header.
+    The first response for a key is cached and replayed for later requests
+    with the same key, without running the view again. Works on DRF view
+    methods and on the async views in async_views.
+    """
+    if asyncio.iscoroutinefunction(view_method):
+        return _async_idempotent(view_method)
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+
+        cache_key = f"idempotency:{request.path}:{key}"
+        fingerprint = _fingerprint(request)
+
+        # cache.add is atomic, so only one request per key runs the view. The
+        # marker expires after IDEMPOTENCY_LOCK_TIMEOUT, so a process that dies
+        # mid-request does not leave its key answering 409 for a day; only
+        # the finished response is kept for IDEMPOTENCY_KEY_TIMEOUT.
+        marker = {"state": IN_PROGRESS, "fingerprint": fingerprint}
+        if not cache.add(cache_key, marker, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            stored = cache.get(cache_key)
+            # The entry expired between add and get: claim the key again, and
+            # if another request got there first, it is the one in progress
+            if stored is None and not cache.add(
+                cache_key, marker, settings.IDEMPOTENCY_LOCK_TIMEOUT
+            ):
+                stored = marker
+            if stored is not None:
+                data, status_code, replayed = _replay(stored, fingerprint)
+                response = Response(data, status=status_code)
+                if replayed:
+                    response["Idempotent-Replayed"] = "true"
+                return response
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+        cache.set(
+            cache_key,
+            {
+                "state": "done",
+                "fingerprint": fingerprint,
+                "data": response.data,
+                "status": response.status_code,
+            },
+            settings.IDEMPOTENCY_KEY_TIMEOUT,
+        )
+        return response
+
+    return wrapper
+
+
+def _async_idempotent(view_method):
+    # Same protocol through the cache's async API; the view returns a
+    # JsonResponse, whose decoded content is what gets replayed.
+    @functools.wraps(view_method)
+    async def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return await view_method(self, request, *args, **kwargs)
+
+        cache_key = f"idempotency:{request.path}:{key}"
+        fingerprint = _fingerprint(request)
+
+        marker = {"state": IN_PROGRESS, "fingerprint": fingerprint}
+        if not await cache.aadd(cache_key, marker, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            stored = await cache.aget(cache_key)
+            if stored is None and not await cache.aadd(
+                cache_key, marker, settings.IDEMPOTENCY_LOCK_TIMEOUT
+            ):
+                stored = marker
+            if stored is not None:
+                data, status_code, replayed = _replay(stored, fingerprint)
+                response = JsonResponse(data, status=status_code)
+                if replayed:
+                    response["Idempotent-Replayed"] = "true"
+                return response
+
+        try:
+            response = await view_method(self, request, *args, **kwargs)
+        except Exception:
+            await cache.adelete(cache_key)
+            raise
+        await cache.aset(
+            cache_key,
+            {
+                "state": "done",
+                "fingerprint": fingerprint,
+                "data": json.loads(response.content),
+                "status": response.status_code,
+            },
+            settings.IDEMPOTENCY_KEY_TIMEOUT,
+        )
+        return response
+
+    return wrapper
@@ -0,0 +1,231 @@
+import functools
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Upper bounds in seconds of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class RequestTimings:
+    # Filled in while a request is served: queries and their total time, and
+    # the time spent in each phase wrapped with timed()
+    __slots__ = ("queries", "db", "phases")
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.phases = defaultdict(float)
+
+
+# The timings of the request being served, None outside of one or when
+# instrumentation is off. Context variables follow the request into
+# sync_to_async threads, so async views are measured too.
+current_timings = ContextVar("current_timings", default=None)
+
+
+def timed(phase):
+    """
+    Adds the wrapped function's time to the phase of the current request,
+    reported in Server-Timing and /metrics. Outside an instrumented request
+    the cost is one context variable read.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = current_timings.get()
+            if timings is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.phases[phase] += time.perf_counter() - started
+
+        return wrapper
+
+    return decorator
+
+
+def record_query(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.db += time.perf_counter() - started
+
+
+def instrument_connection(connection, **kwargs):
+    # First in line, so that execute_wrapper() blocks added and removed
+    # around it (as in bench_api) pop their own wrapper and not this one
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class Metrics:
+    """Per-process totals by endpoint, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = defaultdict(int)
+            self.durations = defaultdict(lambda: [0] * (len(DURATION_BUCKETS) + 1))
+            self.duration_sums = defaultdict(float)
+            self.queries = defaultdict(int)
+            self.db = defaultdict(float)
+            self.phases = defaultdict(float)
+
+    def observe(self, endpoint, method, status, duration, timings):
+        bucket = next(
+            (i for i, bound in enumerate(DURATION_BUCKETS) if duration <= bound),
+            len(DURATION_BUCKETS),
+        )
+        with self.lock:
+            self.requests[endpoint, method, status] += 1
+            self.durations[endpoint][bucket] += 1
+            self.duration_sums[endpoint] += duration
+            self.queries[endpoint] += timings.queries
+            self.db[endpoint] += timings.db
+            for phase, seconds in timings.phases.items():
+                self.phases[endpoint, phase] += seconds
+
+    def render(self):
+        with self.lock:
+            lines = [
+                "# HELP loans_http_requests_total Requests served.",
+                "# TYPE loans_http_requests_total counter",
+            ]
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'loans_http_requests_total{{endpoint="{endpoint}",'
+                    f'method="{method}",status="{status}"}} {count}'
+                )
+
+            lines += [
+                "# HELP loans_http_request_duration_seconds Wall time per request.",
+                "# TYPE loans_http_request_duration_seconds histogram",
+            ]
+            for endpoint, counts in sorted(self.durations.items()):
+                cumulative = 0
+                for bound, count in zip((*DURATION_BUCKETS, "+Inf"), counts):
+                    cumulative += count
+                    lines.append(
+                        f"loans_http_request_duration_seconds_bucket"
+                        f'{{endpoint="{endpoint}",le="{bound}"}} {cumulative}'
+                    )
+                lines.append(
+                    f"loans_http_request_duration_seconds_sum"
+                    f'{{endpoint="{endpoint}"}} {self.duration_sums[endpoint]:.6f}'
+                )
+                lines.append(
+                    f"loans_http_request_duration_seconds_count"
+                    f'{{endpoint="{endpoint}"}} {cumulative}'
+                )
+
+            lines += [
+                "# HELP loans_db_queries_total Database queries run by requests.",
+                "# TYPE loans_db_queries_total counter",
+            ]
+            for endpoint, count in sorted(self.queries.items()):
+                lines.append(f'loans_db_queries_total{{endpoint="{endpoint}"}} {count}')
+
+            lines += [
+                "# HELP loans_db_query_seconds_total Time requests spent in queries.",
+                "# TYPE loans_db_query_seconds_total counter",
+            ]
+            for endpoint, seconds in sorted(self.db.items()):
+                lines.append(
+                    f'loans_db_query_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}'
+                )
+
+            lines += [
+                "# HELP loans_phase_seconds_total Time requests spent in each phase.",
+                "# TYPE loans_phase_seconds_total counter",
+            ]
+            for (endpoint, phase), seconds in sorted(self.phases.items()):
+                lines.append(
+                    f'loans_phase_seconds_total{{endpoint="{endpoint}",'
+                    f'phase="{phase}"}} {seconds:.6f}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class PerformanceMiddleware:
+    """
+    Times each request and its queries and timed() phases, adds them as a
+    Server-Timing header and to the /metrics totals. Removed from the stack
+    at startup unless PERF_INSTRUMENTATION is on.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PERF_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+        connection_created.connect(instrument_connection)
+        # Connections this thread opened before the middleware was loaded
+        for connection in connections.all(initialized_only=True):
+            instrument_connection(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, time.perf_counter() - started, timings)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, time.perf_counter() - started, timings)
+
+    def finish(self, request, response, duration, timings):
+        match = request.resolver_match
+        endpoint = match.view_name if match else "unmatched"
+        metrics.observe(
+            endpoint, request.method, response.status_code, duration, timings
+        )
+
+        entries = [
+            f"total;dur={duration * 1000:.2f}",
+            f'db;dur={timings.db * 1000:.2f};desc="{timings.queries} queries"',
+        ]
+        entries += [
+            f"{phase};dur={seconds * 1000:.2f}"
+            for phase, seconds in timings.phases.items()
+        ]
+        response["Server-Timing"] = ", ".join(entries)
+        return response
@@ -0,0 +1,114 @@
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else was passed in extra=
+RECORD_ATTRIBUTES = set(
+    vars(logging.LogRecord("", logging.INFO, "", 0, "", (), None))
+) | {"message", "asctime", "taskName"}
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    The usual one-line format followed by the record's extra= fields as
+    key=value pairs, so events can be grepped and parsed by field:
+
+        logger.info("Credit scores calculated", extra={"users": 1000})
+    """
+
+    def __init__(self, fmt="%(asctime)s %(levelname)s %(name)s %(message)s", **kwargs):
+        super().__init__(fmt, **kwargs)
+
+    def format(self, record):
+        line = super().format(record)
+        fields = [
+            f"{key}={self.format_value(value)}"
+            for key, value in vars(record).items()
+            if key not in RECORD_ATTRIBUTES and not key.startswith("_")
+        ]
+        if not fields:
+            return line
+        # Keep the fields on the first line when there is a traceback
+        first, _, rest = line.partition("\n")
+        return f"{first} {' '.join(fields)}" + (f"\n{rest}" if rest else "")
+
+    @staticmethod
+    def format_value(value):
+        value = str(value)
+        return f'"{value}"' if not value or any(c.isspace() for c in value) else value
+
+
+class SampleDebugFilter(logging.Filter):
+    """
+    Keeps a random fraction of DEBUG records, so per-item debug events can
+    stay in hot paths without flooding the log when DEBUG is switched on.
+    Records at INFO and above always pass.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    Puts records on an in-memory queue that a background thread drains into
+    the target handlers, so the logging call never waits on the console or
+    the log file. Formatting also happens on that thread.
+
+    In LOGGING the targets are given as cfg:// references to handlers that
+    sort before this one, which dictConfig has created by then:
+
+        "queue": {
+            "class": "loans.log.QueueListenerHandler",
+            "handlers": ["cfg://handlers.console", "cfg://handlers.file"],
+        }
+    """
+
+    def __init__(self, handlers, respect_handler_level=True):
+        super().__init__(queue.SimpleQueue())
+        # Indexing the ConvertingList from dictConfig resolves the references
+        self.targets = [handlers[index] for index in range(len(handlers))]
+        self.respect_handler_level = respect_handler_level
+        self.listener = None
+        self.pid = None
+
+    def start(self):
+        # Also called in each forked worker process, where the parent's
+        # listener thread does not exist and its queue is a stale copy
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(
+            self.queue, *self.targets, respect_handler_level=self.respect_handler_level
+        )
+        self.listener.start()
+        self.pid = os.getpid()
+
+    def prepare(self, record):
+        # The queue never leaves the process, so the record is passed as is
+        # and its message is only built if a target handler accepts it.
+        return record
+
+    def emit(self, record):
+        # Handler.handle holds self.lock, so only one thread starts a listener
+        if self.pid != os.getpid():
+            self.start()
+        super().emit(record)
+
+    def flush(self):
+        # Writes out everything queued so far; the listener restarts on the
+        # next record.
+        with self.lock:
+            if self.listener is not None and self.pid == os.getpid():
+                self.listener.stop()
+                self.pid = None
+            for target in self.targets:
+                target.flush()
+
+    def close(self):
+        self.flush()
+        super().close()
@@ -0,0 +1,395 @@
+import asyncio
+import json
+import os
+import platform
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import date, timedelta
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import AsyncClient, Client
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from loan_management_system.celery import app as celery_app
+from loans.models import User
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile; values must be sorted
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+
+class TestClientDriver:
+    """Drives the API in-process through the Django test client."""
+
+    def __init__(self):
+        self.local = threading.local()
+        # SQLite fails a deferred transaction that upgrades to a write while
+        # another thread holds the write lock, so writes queue up here the
+        # way they would behind BEGIN IMMEDIATE; the wait counts as latency.
+        self.write_lock = (
+            threading.Lock() if connection.vendor == "sqlite" else nullcontext()
+        )
+
+    def request(self, method, path, payload=None):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = Client(raise_request_exception=False)
+
+        # Counted with an execute wrapper on this thread's connection;
+        # CaptureQueriesContext toggles the global reset_queries signal and
+        # miscounts when several threads run it at once.
+        queries = []
+        with connection.execute_wrapper(
+            lambda execute, sql, params, many, context: (
+                queries.append(sql) or execute(sql, params, many, context)
+            )
+        ):
+            started = time.perf_counter()
+            if method == "GET":
+                response = client.get(path)
+            else:
+                with self.write_lock:
+                    response = client.post(
+                        path, payload, content_type="application/json"
+                    )
+            elapsed = time.perf_counter() - started
+
+        body = response.json() if response.status_code == 200 else None
+        return response.status_code, body, elapsed, len(queries)
+
+    def close(self):
+        connections.close_all()
+
+
+class AsyncClientDriver:
+    """
+    Drives the API in-process through the ASGI handler, with all requests
+    in flight on one event loop as under an ASGI server. The ORM runs in a
+    worker thread, so query counts are not available.
+    """
+
+    def __init__(self):
+        self.client = AsyncClient(raise_request_exception=False)
+
+    async def request(self, method, path, payload=None):
+        started = time.perf_counter()
+        if method == "GET":
+            response = await self.client.get(path)
+        else:
+            response = await self.client.post(
+                path, payload, content_type="application/json"
+            )
+        elapsed = time.perf_counter() - started
+
+        body = response.json() if response.status_code == 200 else None
+        return response.status_code, body, elapsed, None
+
+    def close(self):
+        connections.close_all()
+
+
+class HttpDriver:
+    """Drives a running server over HTTP; query counts are not available."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=data,
+            method=method,
+            headers={"Content-Type": "application/json"},
+        )
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                status, content = response.status, response.read()
+        except urllib.error.HTTPError as error:
+            status, content = error.code, error.read()
+        elapsed = time.perf_counter() - started
+
+        body = json.loads(content) if status == 200 else None
+        return status, body, elapsed, None
+
+    def close(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed users, loans and payments through the four API endpoints at a "
+        "given concurrency and report latency, throughput and queries per "
+        "request. Runs against a throwaway test database with eager Celery "
+        "unless --url points at a running server. --asgi uses the /api/async/ "
+        "views, in-process through the ASGI handler or on an ASGI server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--payments", type=int, default=6, help="per loan")
+        parser.add_argument("--statements", type=int, default=5, help="per loan")
+        parser.add_argument("--term", type=int, default=60)
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--url", help="base URL of a running server")
+        parser.add_argument(
+            "--asgi",
+            action="store_true",
+            help="use the async views; compare with a run without it",
+        )
+        parser.add_argument("--output", help="write the JSON report here")
+
+    def handle(self, *args, **options):
+        if options["url"]:
+            driver = HttpDriver(options["url"])
+            report = self.run(driver, options)
+        else:
+            report = self.run_in_process(options)
+
+        text = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(text + "\n")
+        self.print_summary(report)
+
+    def run_in_process(self, options):
+        # A file-backed test database so that worker threads share it
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        if connection.vendor == "sqlite":
+            test_settings["NAME"] = os.path.join(
+                tempfile.mkdtemp(prefix="bench_api_"), "db.sqlite3"
+            )
+        celery_app.conf.task_always_eager = True
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # Everything runs in this process, so its cache needs no Redis
+            with override_settings(CACHES=settings.LOCAL_CACHES):
+                driver = AsyncClientDriver() if options["asgi"] else TestClientDriver()
+                return self.run(driver, options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def run(self, driver, options):
+        run_id = int(time.time() * 1000)
+        # apply-loan has no async variant and is served by the sync view
+        api = "/api/async" if options["asgi"] else "/api"
+        users = [
+            {
+                "aadhar_id": f"bench-{run_id}-{index}",
+                "name": f"Bench User {index}",
+                "email_id": f"bench-{run_id}-{index}@example.com",
+                "annual_income": 1200000,
+            }
+            for index in range(options["users"])
+        ]
+        disbursement_date = str(date.today() + timedelta(days=1))
+
+        phases = {}
+        registered = self.phase(
+            phases,
+            "register-user",
+            driver,
+            options["concurrency"],
+            [("POST", f"{api}/register-user/", user) for user in users],
+        )
+
+        user_ids = [body["unique_user_id"] for body in registered if body]
+        if not user_ids:
+            raise CommandError("register-user registered no users")
+
+        # Scores come from the transaction file, where bench users have no
+        # history; lift them so the loan applications are eligible. With
+        # --url this writes to the database in this process's settings,
+        # which must be the server's (the same DATABASE_URL).
+        lifted = User.objects.filter(aadhar_id__startswith=f"bench-{run_id}-").update(
+            credit_score=700
+        )
+        if lifted != len(user_ids):
+            raise CommandError(
+                f"Found {lifted} of {len(user_ids)} registered bench users in the "
+                f"{connection.vendor} database {connection.settings_dict['NAME']}; "
+                "run bench_api with the server's DATABASE_URL"
+            )
+
+        loans = self.phase(
+            phases,
+            "apply-loan",
+            driver,
+            options["concurrency"],
+            [
+                (
+                    "POST",
+                    "/api/apply-loan/",
+                    {
+                        "user": user_id,
+                        "loan_type": "Car",
+                        "loan_amount": 500000,
+                        "interest_rate": 15,
+                        "term_period": options["term"],
+                        "disbursement_date": disbursement_date,
+                    },
+                )
+                for user_id in user_ids
+            ],
+        )
+        loans = [loan for loan in loans if loan]
+        # Without loans the payment and statement phases would run nothing
+        # and the report would still look complete
+        if not loans:
+            raise CommandError("apply-loan accepted no loan applications")
+
+        # Payments for one loan must arrive in date order, so each loan's
+        # payments form one sequential job
+        self.phase(
+            phases,
+            "make-payment",
+            driver,
+            options["concurrency"],
+            [
+                [
+                    (
+                        "POST",
+                        f"{api}/make-payment/",
+                        {
+                            "loan": loan["loan_id"],
+                            "date": emi["date"],
+                            "amount": emi["amount_due"],
+                        },
+                    )
+                    for emi in loan["due_dates"][: options["payments"]]
+                ]
+                for loan in loans
+            ],
+        )
+        self.phase(
+            phases,
+            "get-statement",
+            driver,
+            options["concurrency"],
+            [
+                ("GET", f"{api}/get-statement/{loan['loan_id']}/", None)
+                for loan in loans
+                for _ in range(options["statements"])
+            ],
+        )
+        driver.close()
+
+        return {
+            "config": {
+                key: options[key]
+                for key in (
+                    "users",
+                    "payments",
+                    "statements",
+                    "term",
+                    "concurrency",
+                    "asgi",
+                )
+            }
+            | {"target": options["url"] or "test-client"},
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+            },
+            "endpoints": phases,
+        }
+
+    def phase(self, phases, name, driver, concurrency, jobs):
+        # A job is a single request or a list of requests run in order
+        def run_job(job):
+            results = []
+            for method, path, payload in job if isinstance(job, list) else [job]:
+                results.append(driver.request(method, path, payload))
+            if isinstance(driver, TestClientDriver):
+                connection.close()
+            return results
+
+        started = time.perf_counter()
+        if isinstance(driver, AsyncClientDriver):
+            results = asyncio.run(self.run_async(driver, concurrency, jobs))
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = [
+                    result
+                    for job_results in pool.map(run_job, jobs)
+                    for result in job_results
+                ]
+        wall_time = time.perf_counter() - started
+
+        latencies = sorted(elapsed for _, _, elapsed, _ in results)
+        query_counts = [count for _, _, _, count in results if count is not None]
+        phases[name] = {
+            "requests": len(results),
+            "errors": sum(1 for status, _, _, _ in results if status != 200),
+            "requests_per_second": (
+                round(len(results) / wall_time, 1) if wall_time else None
+            ),
+            "latency_ms": {
+                label: (
+                    round(percentile(latencies, fraction) * 1000, 2)
+                    if latencies
+                    else None
+                )
+                for label, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+            },
+            "queries_per_request": (
+                round(sum(query_counts) / len(query_counts), 2)
+                if query_counts
+                else None
+            ),
+        }
+        return [body for _, body, _, _ in results]
+
+    async def run_async(self, driver, concurrency, jobs):
+        # Up to concurrency jobs in flight at once on the event loop
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_job(job):
+            async with semaphore:
+                return [
+                    await driver.request(method, path, payload)
+                    for method, path, payload in (
+                        job if isinstance(job, list) else [job]
+                    )
+                ]
+
+        return [
+            result
+            for job_results in await asyncio.gather(*map(run_job, jobs))
+            for result in job_results
+        ]
+
+    def print_summary(self, report):
+        self.stdout.write(
+            f"{'endpoint':<15}{'reqs':>7}{'errors':>8}{'req/s':>9}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}"
+        )
+        for name, stats in report["endpoints"].items():
+            latency = stats["latency_ms"]
+            self.stdout.write(
+                f"{name:<15}{stats['requests']:>7}{stats['errors']:>8}"
+                f"{stats['requests_per_second'] or 0:>9}"
+                f"{latency['p50'] or 0:>9}{latency['p95'] or 0:>9}"
+                f"{latency['p99'] or 0:>9}{stats['queries_per_request'] or '-':>9}"
+            )
@@ -0,0 +1,110 @@
+import random
+import time
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand, CommandError
+
+from loans.utils import calculate_emi, calculate_emi_schedules
+
+
+def reference_calculate_emi(loan_amount, interest_rate, term_period, disbursement_date):
+    # The original per-month float loop, kept as the parity and speed baseline
+    monthly_interest_rate = interest_rate / (12 * 100)
+    emi_amount = (
+        loan_amount
+        * monthly_interest_rate
+        * ((1 + monthly_interest_rate) ** term_period)
+        / (((1 + monthly_interest_rate) ** term_period) - 1)
+    )
+
+    emi_dates = []
+    remaining_principal = loan_amount
+
+    for i in range(term_period):
+        interest_for_month = remaining_principal * monthly_interest_rate
+        principal_for_month = emi_amount - interest_for_month
+        remaining_principal -= principal_for_month
+        emi_date = (disbursement_date + relativedelta(months=i + 1)).replace(day=1)
+        emi_dates.append(
+            {
+                "date": emi_date.strftime("%Y-%m-%d"),
+                "amount_due": round(emi_amount, 2),
+            }
+        )
+
+    if remaining_principal > 0:
+        last_emi_date = (disbursement_date + relativedelta(months=term_period)).replace(
+            day=1
+        )
+        emi_dates[-1] = {
+            "date": last_emi_date.strftime("%Y-%m-%d"),
+            "amount_due": round(
+                remaining_principal + (emi_dates[-1]["amount_due"] - emi_amount), 2
+            ),
+        }
+
+    return emi_amount, emi_dates
+
+
+class Command(BaseCommand):
+    help = "Benchmark calculate_emi against the original per-month float loop"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loans", type=int, default=1000)
+        parser.add_argument("--term", type=int, default=360)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        loans = [
+            (
+                float(rng.randrange(100000, 8500000)) + rng.randrange(100) / 100,
+                rng.choice([14, 14.5, 15, 16.25, 18, 21.75, 24]),
+                rng.randint(1, options["term"]),
+                date(2024, 1, 1) + timedelta(days=rng.randrange(3650)),
+            )
+            for _ in range(options["loans"])
+        ]
+
+        started = time.perf_counter()
+        expected = [reference_calculate_emi(*loan) for loan in loans]
+        reference_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        single = [calculate_emi(*loan) for loan in loans]
+        single_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        batched = calculate_emi_schedules(*zip(*loans))
+        batched_time = time.perf_counter() - started
+
+        # The exact engine may differ from the float loop by a paisa where
+        # float rounding lands on the other side of a half, and settles the
+        # rounding drift on the last EMI, which the float loop did not.
+        for index, loan in enumerate(loans):
+            if single[index] != batched[index]:
+                raise CommandError(f"Schedule mismatch for loan {loan}")
+            emi_dates, expected_dates = single[index][1], expected[index][1]
+            for emi, expected_emi in zip(emi_dates[:-1], expected_dates[:-1]):
+                if (
+                    emi["date"] != expected_emi["date"]
+                    or abs(float(emi["amount_due"]) - expected_emi["amount_due"])
+                    > 0.011
+                ):
+                    raise CommandError(f"Schedule differs from the loop for {loan}")
+
+        rows = sum(loan[2] for loan in loans)
+        self.stdout.write(
+            f"{len(loans)} loans, {rows} installments, "
+            "within a paisa of the float loop"
+        )
+        for label, elapsed in (
+            ("reference loop", reference_time),
+            ("calculate_emi", single_time),
+            ("calculate_emi_schedules", batched_time),
+        ):
+            self.stdout.write(
+                f"{label:<24} {elapsed * 1000:10.1f} ms "
+                f"{reference_time / elapsed:6.1f}x"
+            )
@@ -0,0 +1,194 @@
+import json
+import os
+import platform
+import tempfile
+import threading
+import time
+import uuid
+
+import celery
+import pandas as pd
+from celery.contrib.testing.worker import start_worker
+from celery.signals import task_failure, task_postrun
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from loan_management_system.celery import app as celery_app
+from loans.balance_cache import balance_cache
+from loans.models import User
+from loans.tasks import calculate_credit_score, calculate_credit_scores
+
+from .bench_api import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue credit score tasks for seeded users and report task throughput "
+        "and queue-to-finish latency. Runs a worker in this process against a "
+        "throwaway test database, on the in-memory broker unless --broker is "
+        "given, so Redis is not needed. --batch-size > 1 uses "
+        "calculate_credit_scores."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1,
+            help="users per task; 1 queues calculate_credit_score per user",
+        )
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--broker", default="memory://")
+        # Celery polls the in-memory broker with its blocking loop, which
+        # applies acknowledgements only between two-second polls, so any
+        # prefetch limit stalls it. Measure prefetch against Redis.
+        parser.add_argument(
+            "--prefetch-multiplier",
+            type=int,
+            default=0,
+            help="0 for no limit, the default; set it with --broker redis://...",
+        )
+        parser.add_argument("--output", help="write the JSON report here")
+
+    def handle(self, *args, **options):
+        # A file-backed test database so that worker threads share it
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        if connection.vendor == "sqlite":
+            test_settings["NAME"] = os.path.join(
+                tempfile.mkdtemp(prefix="bench_tasks_"), "db.sqlite3"
+            )
+        # Celery reads the broker from the environment before its settings
+        os.environ["CELERY_BROKER_URL"] = options["broker"]
+        celery_app.conf.update(
+            task_always_eager=False,
+            # Transports without push delivery poll their queues; the default
+            # of one second would dominate task latency
+            broker_transport_options={"polling_interval": 0.001},
+        )
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # The worker runs in this process, so its cache needs no Redis
+            with override_settings(CACHES=settings.LOCAL_CACHES):
+                report = self.run(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        text = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(text + "\n")
+        self.stdout.write(
+            f"{report['tasks']} tasks for {report['users']} users, "
+            f"{report['failures']} failed: {report['tasks_per_second']} tasks/s, "
+            f"{report['users_per_second']} users/s, latency ms "
+            f"p50 {report['latency_ms']['p50']} p95 {report['latency_ms']['p95']} "
+            f"p99 {report['latency_ms']['p99']}"
+        )
+
+    def run(self, options):
+        # Users from the transaction file, so scoring finds real balances
+        aadhar_ids = (
+            pd.read_csv(settings.TRANSACTIONS_FILE, usecols=["user"], dtype=str)["user"]
+            .drop_duplicates()
+            .tolist()
+        )
+        aadhar_ids += [
+            f"bench-{index}" for index in range(len(aadhar_ids), options["users"])
+        ]
+        aadhar_ids = aadhar_ids[: options["users"]]
+        User.objects.bulk_create(
+            [
+                User(
+                    aadhar_id=aadhar_id,
+                    name=f"Bench User {index}",
+                    email_id=f"bench-{index}@example.com",
+                    annual_income=1200000,
+                )
+                for index, aadhar_id in enumerate(aadhar_ids)
+            ],
+            batch_size=1000,
+        )
+        # As worker_process_init does in a prefork pool
+        balance_cache.load()
+
+        batch_size = options["batch_size"]
+        if batch_size > 1:
+            jobs = [
+                (calculate_credit_scores, (aadhar_ids[start : start + batch_size],))
+                for start in range(0, len(aadhar_ids), batch_size)
+            ]
+        else:
+            jobs = [(calculate_credit_score, (aadhar_id,)) for aadhar_id in aadhar_ids]
+        # IDs up front, so that only these tasks are counted and a task
+        # finishing before apply_async returns is still matched
+        jobs = [(str(uuid.uuid4()), task, args) for task, args in jobs]
+
+        queued = {}
+        finished = {}
+        failures = []
+        done = threading.Event()
+
+        def on_postrun(task_id=None, **kwargs):
+            if task_id not in queued:
+                return
+            finished[task_id] = time.perf_counter()
+            connection.close()
+            if len(finished) == len(jobs):
+                done.set()
+
+        def on_failure(task_id=None, exception=None, **kwargs):
+            failures.append(repr(exception))
+
+        task_postrun.connect(on_postrun, weak=False)
+        task_failure.connect(on_failure, weak=False)
+        try:
+            with start_worker(
+                celery_app,
+                concurrency=options["concurrency"],
+                pool="threads",
+                perform_ping_check=False,
+                queues=["scoring"],
+                prefetch_multiplier=options["prefetch_multiplier"],
+            ):
+                started = time.perf_counter()
+                for task_id, task, args in jobs:
+                    queued[task_id] = time.perf_counter()
+                    task.apply_async(args, task_id=task_id)
+                done.wait()
+                wall_time = time.perf_counter() - started
+        finally:
+            task_postrun.disconnect(on_postrun)
+            task_failure.disconnect(on_failure)
+
+        latencies = sorted(finished[task_id] - queued[task_id] for task_id in queued)
+        return {
+            "config": {
+                key: options[key]
+                for key in ("users", "batch_size", "concurrency", "prefetch_multiplier")
+            }
+            | {"broker": options["broker"]},
+            "environment": {
+                "python": platform.python_version(),
+                "celery": celery.__version__,
+                "database": connection.vendor,
+            },
+            "users": len(aadhar_ids),
+            "tasks": len(jobs),
+            "failures": len(failures),
+            "tasks_per_second": round(len(jobs) / wall_time, 1),
+            "users_per_second": round(len(aadhar_ids) / wall_time, 1),
+            "latency_ms": {
+                label: round(percentile(latencies, fraction) * 1000, 2)
+                for label, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+            },
+        }
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from loans.transaction_store import build_store
+from loans.transactions import normalise_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert the transaction CSV into the memory-mapped columnar store "
+        "used for credit scoring"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default=str(settings.TRANSACTIONS_FILE))
+        parser.add_argument("--output", default=str(settings.TRANSACTION_STORE_DIR))
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            rows = build_store(options["source"], options["output"])
+        except ValueError as error:
+            raise CommandError(f"{error}; the current store was kept")
+        self.stdout.write(
+            f"Wrote {rows} transactions to {options['output']} "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        # Only a store of the configured file is read by the workers
+        if normalise_path(options["source"]) != normalise_path(
+            settings.TRANSACTIONS_FILE
+        ):
+            self.stderr.write(
+                self.style.WARNING(
+                    f"{options['source']} is not TRANSACTIONS_FILE "
+                    f"({settings.TRANSACTIONS_FILE}), so the store will not be used"
+                )
+            )
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from loans.payment_import import import_settlement
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a bank settlement CSV (loan_id,date,amount), grouped by loan, "
+        "as payments. The file is streamed; each loan's payments are applied "
+        "in date order in memory and written in chunked transactions; rows "
+        "that cannot be applied go to a rejects file with the reason."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--rejects", help="rejects CSV, by default <path>.rejects.csv"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.PAYMENT_IMPORT_CHUNK_SIZE,
+            help="loans per transaction",
+        )
+
+    def handle(self, *args, **options):
+        rejects = options["rejects"] or f"{options['path']}.rejects.csv"
+        try:
+            counts = import_settlement(
+                options["path"], rejects, options["chunk_size"], self.progress
+            )
+        except ValueError as error:
+            raise CommandError(error)
+
+        self.stdout.write(
+            f"{options['path']}: {counts['rows']} rows, {counts['imported']} "
+            f"imported, {counts['rejected']} rejected"
+        )
+        if counts["rejected"]:
+            self.stdout.write(f"Rejected rows written to {rejects}")
+
+    def progress(self, loans, rows):
+        self.stdout.write(f"{loans} loans, {rows} rows", ending="\r")
+        self.stdout.flush()
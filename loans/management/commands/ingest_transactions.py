@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from loans.transactions import ingest_files
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream transaction CSV files into the per-user balance index in "
+        "bounded memory. Files already ingested unchanged are skipped, so "
+        "daily files can be appended without reprocessing history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", default=[settings.TRANSACTIONS_FILE])
+        parser.add_argument(
+            "--max-memory",
+            type=int,
+            default=settings.TRANSACTION_INGEST_MAX_MEMORY_MB,
+            help="memory ceiling in MB",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="clear the index and re-read every ingested file",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            results = ingest_files(
+                options["paths"],
+                rebuild=options["rebuild"],
+                max_memory_mb=options["max_memory"],
+                progress=self.progress,
+            )
+        except ValueError as error:
+            raise CommandError(f"{error}; rerun with --rebuild")
+
+        for path, result in results.items():
+            if result is None:
+                self.stdout.write(f"{path}: already ingested")
+            else:
+                self.stdout.write(
+                    f"{path}: {result['rows']} rows, {result['invalid']} invalid"
+                )
+
+    def progress(self, path, position, size, rows):
+        self.stdout.write(f"{path}: {position / size:6.1%} {rows} rows", ending="\r")
+        self.stdout.flush()
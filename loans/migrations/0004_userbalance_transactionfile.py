@@ -0,0 +1,47 @@
+# Generated by Django 4.2.13 on 2026-10-17 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("loans", "0003_alter_user_aadhar_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TransactionFile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("path", models.CharField(max_length=255, unique=True)),
+                ("fingerprint", models.CharField(max_length=64)),
+                ("row_count", models.IntegerField(default=0)),
+                ("ingested_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="UserBalance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("aadhar_id", models.CharField(max_length=36, unique=True)),
+                ("balance", models.DecimalField(decimal_places=2, max_digits=18)),
+                ("transaction_count", models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.2.13 on 2026-10-17 16:19
+
+from datetime import date
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_emi_dates(apps, schema_editor):
+    LoanApplication = apps.get_model("loans", "LoanApplication")
+    Installment = apps.get_model("loans", "Installment")
+    for loan in LoanApplication.objects.only("id", "emi_dates").iterator():
+        Installment.objects.bulk_create(
+            [
+                Installment(
+                    loan_id=loan.id,
+                    due_date=date.fromisoformat(emi["date"]),
+                    amount_due=round(Decimal(str(emi["amount_due"])), 2),
+                )
+                for emi in loan.emi_dates
+                if emi["amount_due"] > 0
+            ]
+        )
+
+
+def restore_emi_dates(apps, schema_editor):
+    LoanApplication = apps.get_model("loans", "LoanApplication")
+    Installment = apps.get_model("loans", "Installment")
+    for loan in LoanApplication.objects.only("id").iterator():
+        loan.emi_dates = [
+            {
+                "date": installment.due_date.strftime("%Y-%m-%d"),
+                "amount_due": float(installment.amount_due),
+            }
+            for installment in Installment.objects.filter(
+                loan_id=loan.id, paid=False
+            ).order_by("due_date")
+        ]
+        loan.save(update_fields=["emi_dates"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("loans", "0004_userbalance_transactionfile"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Installment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("due_date", models.DateField()),
+                ("amount_due", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("paid", models.BooleanField(default=False)),
+                (
+                    "loan",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="installments",
+                        to="loans.loanapplication",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["due_date"],
+                "indexes": [
+                    models.Index(
+                        fields=["loan", "due_date"],
+                        name="loans_insta_loan_id_cdaf83_idx",
+                    ),
+                    models.Index(
+                        fields=["due_date", "paid"],
+                        name="loans_insta_due_dat_9e3487_idx",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(copy_emi_dates, restore_emi_dates),
+        migrations.RemoveField(
+            model_name="loanapplication",
+            name="emi_dates",
+        ),
+    ]
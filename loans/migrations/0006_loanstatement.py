@@ -0,0 +1,53 @@
+# Generated by Django 4.2.13 on 2026-10-17 16:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("loans", "0005_installment"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="interest",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=12, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="principal",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=12, null=True
+            ),
+        ),
+        migrations.CreateModel(
+            name="LoanStatement",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("emi_amount", models.FloatField()),
+                ("remaining_principal", models.FloatField()),
+                ("last_payment_date", models.DateField(blank=True, null=True)),
+                ("payment_count", models.IntegerField(default=0)),
+                (
+                    "loan",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="statement",
+                        to="loans.loanapplication",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-17 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("loans", "0006_loanstatement"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="payment",
+            constraint=models.UniqueConstraint(
+                fields=("loan", "date"), name="unique_payment_per_loan_date"
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.13 on 2026-10-17 17:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("loans", "0007_unique_payment_per_loan_date"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="loanstatement",
+            name="emi_amount",
+            field=models.DecimalField(decimal_places=2, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name="loanstatement",
+            name="remaining_principal",
+            field=models.DecimalField(decimal_places=2, max_digits=12),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.13 on 2026-10-17 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("loans", "0008_statement_amounts_decimal"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DelinquencySnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                (
+                    "loan_type",
+                    models.CharField(
+                        choices=[
+                            ("Car", "Car"),
+                            ("Home", "Home"),
+                            ("Education", "Education"),
+                            ("Personal", "Personal"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("bucket", models.CharField(max_length=8)),
+                ("loan_count", models.IntegerField(default=0)),
+                (
+                    "overdue_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=18),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="installment",
+            name="overdue",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddConstraint(
+            model_name="delinquencysnapshot",
+            constraint=models.UniqueConstraint(
+                fields=("date", "loan_type", "bucket"),
+                name="unique_delinquency_snapshot_row",
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.13 on 2026-10-17 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("loans", "0009_delinquency"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DelinquencyChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("first_id", models.BigIntegerField()),
+                ("last_id", models.BigIntegerField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="delinquencychunk",
+            constraint=models.UniqueConstraint(
+                fields=("date", "first_id"), name="unique_delinquency_chunk"
+            ),
+        ),
+    ]
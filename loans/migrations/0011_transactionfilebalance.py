@@ -0,0 +1,44 @@
+# Generated by Django 4.2.13 on 2026-10-17 18:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("loans", "0010_delinquencychunk"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TransactionFileBalance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("aadhar_id", models.CharField(max_length=36)),
+                ("balance", models.DecimalField(decimal_places=2, max_digits=18)),
+                (
+                    "file",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="balances",
+                        to="loans.transactionfile",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="transactionfilebalance",
+            constraint=models.UniqueConstraint(
+                fields=("file", "aadhar_id"), name="unique_transaction_file_balance"
+            ),
+        ),
+    ]
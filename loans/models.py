@@ -25,13 +25,137 @@ class LoanApplication(models.Model):
     term_period = models.IntegerField()  # in months
     disbursement_date = models.DateField()
     loan_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
-    emi_dates = models.JSONField(
-        default=list
-    )  # List of dicts with 'date' and 'amount_due'
     is_closed = models.BooleanField(default=False)
 
+    def upcoming_emis(self):
+        # List of dicts with 'date' and 'amount_due' for installments still due
+        return [
+            {
+                "date": installment.due_date.strftime("%Y-%m-%d"),
+                "amount_due": float(installment.amount_due),
+            }
+            for installment in self.installments.filter(paid=False)
+        ]
+
+
+class Installment(models.Model):
+    loan = models.ForeignKey(
+        LoanApplication, on_delete=models.CASCADE, related_name="installments"
+    )
+    due_date = models.DateField()
+    amount_due = models.DecimalField(max_digits=12, decimal_places=2)
+    paid = models.BooleanField(default=False)
+    # Set by the nightly delinquency batch once the installment is past due
+    # and unpaid; kept after a late payment as a record of the delinquency.
+    overdue = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["due_date"]
+        indexes = [
+            models.Index(fields=["loan", "due_date"]),
+            models.Index(fields=["due_date", "paid"]),
+        ]
+
 
 class Payment(models.Model):
     loan = models.ForeignKey(LoanApplication, on_delete=models.CASCADE)
     date = models.DateField()
     amount = models.DecimalField(max_digits=12, decimal_places=2)
+    # Principal/interest split of the payment, filled in by loans.statements
+    principal = models.DecimalField(
+        max_digits=12, decimal_places=2, null=True, blank=True
+    )
+    interest = models.DecimalField(
+        max_digits=12, decimal_places=2, null=True, blank=True
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["loan", "date"], name="unique_payment_per_loan_date"
+            )
+        ]
+
+
+class LoanStatement(models.Model):
+    # Running state of the amortisation replay over a loan's payments, so a
+    # new payment only needs the next step instead of a full replay.
+    loan = models.OneToOneField(
+        LoanApplication, on_delete=models.CASCADE, related_name="statement"
+    )
+    emi_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    remaining_principal = models.DecimalField(max_digits=12, decimal_places=2)
+    last_payment_date = models.DateField(null=True, blank=True)
+    payment_count = models.IntegerField(default=0)
+
+
+class DelinquencySnapshot(models.Model):
+    # Per-day portfolio summary written by the nightly delinquency batch:
+    # open loans and their overdue amount by loan type and days-past-due
+    # bucket, so dashboards never scan the installments themselves.
+    BUCKETS = ("current", "1-30", "31-60", "61-90", "90+")
+
+    date = models.DateField()
+    loan_type = models.CharField(max_length=10, choices=LoanApplication.LOAN_TYPES)
+    bucket = models.CharField(max_length=8)
+    loan_count = models.IntegerField(default=0)
+    overdue_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "loan_type", "bucket"],
+                name="unique_delinquency_snapshot_row",
+            )
+        ]
+
+
+class DelinquencyChunk(models.Model):
+    # Loan ranges of the nightly batch already added to a day's snapshot,
+    # written in the chunk's transaction so that a redelivered chunk is
+    # skipped instead of counted twice.
+    date = models.DateField()
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "first_id"], name="unique_delinquency_chunk"
+            )
+        ]
+
+
+class UserBalance(models.Model):
+    # Net balance (credits minus debits) per aadhar_id, precomputed from the
+    # transaction history so credit scoring is a single keyed read.
+    aadhar_id = models.CharField(max_length=36, unique=True)
+    balance = models.DecimalField(max_digits=18, decimal_places=2)
+    transaction_count = models.IntegerField(default=0)
+
+
+class TransactionFile(models.Model):
+    # Source files the balance index was built from, with the fingerprint
+    # (size and mtime) used to detect when the index is stale.
+    path = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    row_count = models.IntegerField(default=0)
+    ingested_at = models.DateTimeField(auto_now=True)
+
+
+class TransactionFileBalance(models.Model):
+    # Net balance each ingested file added per user, so the balances of files
+    # appended after the columnar store was built are a query away instead
+    # of a re-read of the files themselves.
+    file = models.ForeignKey(
+        TransactionFile, on_delete=models.CASCADE, related_name="balances"
+    )
+    aadhar_id = models.CharField(max_length=36)
+    balance = models.DecimalField(max_digits=18, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["file", "aadhar_id"], name="unique_transaction_file_balance"
+            )
+        ]
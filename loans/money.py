@@ -0,0 +1,72 @@
+from decimal import ROUND_HALF_UP, Decimal
+from fractions import Fraction
+from functools import lru_cache
+from math import lcm
+from typing import NamedTuple
+
+
+def to_paise(amount):
+    # Rupees (Decimal, int, float or str) to integer paise, rounding half up
+    return int((Decimal(str(amount)) * 100).quantize(1, rounding=ROUND_HALF_UP))
+
+
+def from_paise(paise):
+    return Decimal(paise).scaleb(-2)
+
+
+def round_half_up(numerator, denominator):
+    # Nearest integer to numerator / denominator, halves rounding up
+    return (2 * numerator + denominator) // (2 * denominator)
+
+
+def max_emi_paise(annual_income):
+    # 60% of the monthly income, rounded down to the paisa
+    return to_paise(annual_income) * 6 // 120
+
+
+class RateFactors(NamedTuple):
+    # growth is (1 + r) ** n and accumulation is ((1 + r) ** n - 1) / r, both
+    # over denominator, so the EMI and the closing balance need only integer
+    # products with the principal.
+    rate: Fraction
+    growth: int
+    accumulation: int
+    denominator: int
+
+
+@lru_cache(maxsize=256)
+def monthly_rate(interest_rate):
+    # Annual percentage rate to the exact monthly rate r
+    return Fraction(Decimal(str(interest_rate))) / 1200
+
+
+@lru_cache(maxsize=4096)
+def rate_factors(interest_rate, term_period):
+    rate = monthly_rate(interest_rate)
+    growth = (1 + rate) ** term_period
+    accumulation = (growth - 1) / rate if rate else Fraction(term_period)
+    denominator = lcm(growth.denominator, accumulation.denominator)
+    return RateFactors(
+        rate,
+        growth.numerator * (denominator // growth.denominator),
+        accumulation.numerator * (denominator // accumulation.denominator),
+        denominator,
+    )
+
+
+def emi_paise(principal, factors):
+    # P * r(1 + r)^n / ((1 + r)^n - 1), rounded to the paisa
+    return round_half_up(principal * factors.growth, factors.accumulation)
+
+
+def balance_after_term(principal, emi, factors):
+    # Principal left after paying emi for the whole term, accruing interest
+    # exactly: P(1 + r)^n - EMI((1 + r)^n - 1) / r
+    return round_half_up(
+        principal * factors.growth - emi * factors.accumulation, factors.denominator
+    )
+
+
+def interest_paise(balance, factors):
+    # One month of interest on balance, rounded to the paisa
+    return round_half_up(balance * factors.rate.numerator, factors.rate.denominator)
@@ -0,0 +1,136 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .eligibility import (
+    LOAN_LIMITS,
+    MIN_ANNUAL_INCOME,
+    MIN_CREDIT_SCORE,
+    MIN_INTEREST_RATE,
+    MIN_TOTAL_INTEREST,
+)
+from .models import User
+from .money import emi_paise, from_paise, max_emi_paise, rate_factors, to_paise
+
+
+def offer_cache_key(user_id):
+    return f"offer:{user_id}"
+
+
+def offer_generation_key(user_id):
+    return f"offer-generation:{user_id}"
+
+
+def invalidate_offers(user_ids):
+    # Quotes depend on the credit score and income, so whatever changes
+    # either gives the users new generations once its transaction commits.
+    # Quotes are cached with the generation read before they were made, so
+    # one made from the old score and cached after the commit is not served.
+    generations = {
+        offer_generation_key(user_id): uuid.uuid4().hex for user_id in user_ids
+    }
+    transaction.on_commit(lambda: cache.set_many(generations, None))
+
+
+def _smallest_principal(emi, factors):
+    # Smallest principal in paise whose emi_paise() is at least emi:
+    # round_half_up(P * growth, accumulation) >= emi solved for P
+    numerator = factors.accumulation * (2 * emi - 1)
+    return -(-numerator // (2 * factors.growth))
+
+
+def principal_range(max_emi, term_period, interest_rate):
+    """
+    The loan amounts in paise, as (smallest, largest), whose EMI is at most
+    max_emi and whose total interest is above MIN_TOTAL_INTEREST, the same
+    rules evaluate_applications applies. Both ends are solved from the
+    annuity factors rather than by trying amounts.
+    """
+    factors = rate_factors(interest_rate, term_period)
+    largest = _smallest_principal(max_emi + 1, factors) - 1
+
+    # Total interest emi * n - P only drops within the amounts sharing one
+    # EMI, so the smallest amount from which every larger one passes is the
+    # first of the lowest EMI whose last amount still passes
+    def passes(emi):
+        last = _smallest_principal(emi + 1, factors) - 1
+        return emi * term_period - last > MIN_TOTAL_INTEREST * 100
+
+    # emi * n - P(emi + 1) grows by n - accumulation / growth per paisa of
+    # EMI, which is positive for any positive rate
+    step = term_period - factors.accumulation / factors.growth
+    emi = max(
+        1,
+        int(
+            (MIN_TOTAL_INTEREST * 100 + factors.accumulation / (2 * factors.growth))
+            / step
+        ),
+    )
+    while emi > 1 and passes(emi - 1):
+        emi -= 1
+    while not passes(emi):
+        emi += 1
+    return _smallest_principal(emi, factors), largest
+
+
+def quote_offers(user, interest_rate=MIN_INTEREST_RATE, tenors=None):
+    """
+    Loan offers for user at interest_rate: for every loan type and each of
+    tenors (LOAN_OFFER_TENORS by default), the smallest and largest amounts
+    apply-loan accepts and the EMI of the largest. Users below the credit
+    score or income floor get no offers.
+    """
+    quote = {
+        "user": str(user.unique_user_id),
+        "credit_score": user.credit_score,
+        "interest_rate": interest_rate,
+        "max_emi": None,
+        "offers": [],
+    }
+    if (
+        user.credit_score < MIN_CREDIT_SCORE
+        or to_paise(user.annual_income) < MIN_ANNUAL_INCOME * 100
+    ):
+        return quote
+
+    max_emi = max_emi_paise(user.annual_income)
+    quote["max_emi"] = float(from_paise(max_emi))
+    for term_period in tenors or settings.LOAN_OFFER_TENORS:
+        smallest, largest = principal_range(max_emi, term_period, interest_rate)
+        factors = rate_factors(interest_rate, term_period)
+        for loan_type, limit in LOAN_LIMITS.items():
+            amount = min(largest, limit * 100)
+            if amount < smallest:
+                continue
+            quote["offers"].append(
+                {
+                    "loan_type": loan_type,
+                    "term_period": term_period,
+                    "min_amount": float(from_paise(smallest)),
+                    "max_amount": float(from_paise(amount)),
+                    "emi_amount": float(from_paise(emi_paise(amount, factors))),
+                }
+            )
+    return quote
+
+
+def get_offers(user_id):
+    """
+    The offers of the user with unique_user_id user_id at the default rate,
+    from the cache when present so a quote needs no query. None if there is
+    no such user.
+    """
+    key, generation_key = offer_cache_key(user_id), offer_generation_key(user_id)
+    entries = cache.get_many([key, generation_key])
+    cached = entries.get(key)
+    if cached is not None and cached[0] == entries.get(generation_key):
+        return cached[1]
+
+    user = User.objects.filter(unique_user_id=user_id).first()
+    if user is None:
+        return None
+    quote = quote_offers(user)
+    cache.set(key, (entries.get(generation_key), quote), settings.OFFER_CACHE_TIMEOUT)
+    return quote
@@ -0,0 +1,178 @@
+import csv
+import uuid
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+
+from .cashflow import invalidate_cashflow
+from .models import Installment, LoanApplication, Payment
+from .money import from_paise, max_emi_paise, to_paise
+from .statements import record_payments
+from .utils import apply_payment
+
+SETTLEMENT_COLUMNS = ("loan_id", "date", "amount")
+REJECT_COLUMNS = ("line", *SETTLEMENT_COLUMNS, "reason")
+
+
+def read_settlement(path, reject):
+    """
+    Yields the rows of a settlement CSV one at a time as (loan_id, date,
+    paise, row), where row is the line number and the raw values for reject
+    reports. Rows that do not parse are passed to reject(row, reason) instead.
+    """
+    with open(path, newline="") as handle:
+        reader = csv.DictReader(handle)
+        missing = set(SETTLEMENT_COLUMNS) - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"{path} has no {', '.join(sorted(missing))} column")
+        for record in reader:
+            row = (reader.line_num, *(record[column] for column in SETTLEMENT_COLUMNS))
+            try:
+                loan_id = uuid.UUID(record["loan_id"])
+                payment_date = date.fromisoformat(record["date"])
+                amount = Decimal(record["amount"])
+            except (TypeError, ValueError, InvalidOperation):
+                reject(row, "Unreadable loan_id, date or amount")
+                continue
+            if not amount.is_finite() or amount <= 0:
+                reject(row, "Amount must be positive")
+                continue
+            yield loan_id, payment_date, to_paise(amount), row
+
+
+def import_loan_payments(loan_payments, reject):
+    """
+    Applies the payments of one chunk of loans, given as {loan_id: [(date,
+    paise, row)]}, in one transaction: every loan's payments in date order
+    against its unpaid installments held in memory, with the checks of
+    PaymentSerializer. Returns the number of payments imported.
+    """
+    with transaction.atomic():
+        loans = {
+            loan.loan_id: loan
+            for loan in LoanApplication.objects.select_for_update(of=("self",))
+            .select_related("user")
+            .filter(loan_id__in=loan_payments)
+        }
+        paid_dates = set(
+            Payment.objects.filter(loan__in=loans.values()).values_list(
+                "loan_id", "date"
+            )
+        )
+        unpaid = defaultdict(list)
+        for installment_id, loan_pk, due_date, amount_due in (
+            Installment.objects.filter(loan__in=loans.values(), paid=False)
+            .order_by("loan_id", "due_date")
+            .values_list("id", "loan_id", "due_date", "amount_due")
+        ):
+            unpaid[loan_pk].append([installment_id, due_date, to_paise(amount_due)])
+
+        payments = []
+        changed = {}
+        for loan_id, rows in loan_payments.items():
+            loan = loans.get(loan_id)
+            for payment_date, amount, row in sorted(rows, key=lambda r: r[0]):
+                if loan is None:
+                    reject(row, "Invalid loan ID")
+                    continue
+                if (loan.pk, payment_date) in paid_dates:
+                    reject(row, "A payment for this loan on this date already exists")
+                    continue
+                installments = unpaid[loan.pk]
+                if installments and installments[0][1] < payment_date:
+                    reject(row, "Previous EMIs are due")
+                    continue
+
+                delta = apply_payment(
+                    (
+                        (index, due_date, amount_due)
+                        for index, (_, due_date, amount_due) in enumerate(installments)
+                    ),
+                    payment_date,
+                    amount,
+                    max_emi_paise(loan.user.annual_income),
+                )
+                for index, amount_due in delta.items():
+                    installments[index][2] = amount_due
+                    changed[installments[index][0]] = amount_due
+                unpaid[loan.pk] = [i for i in installments if i[2] > 0]
+
+                paid_dates.add((loan.pk, payment_date))
+                payments.append(
+                    Payment(loan=loan, date=payment_date, amount=from_paise(amount))
+                )
+
+        Installment.objects.bulk_update(
+            [
+                Installment(
+                    id=installment_id,
+                    amount_due=from_paise(amount_due),
+                    paid=amount_due <= 0,
+                )
+                for installment_id, amount_due in changed.items()
+            ],
+            ["amount_due", "paid"],
+            batch_size=1000,
+        )
+        record_payments(payments)
+
+        chunks = {
+            payment.loan_id // settings.CASHFLOW_CHUNK_SIZE: payment.loan_id
+            for payment in payments
+        }
+        for loan_pk in chunks.values():
+            invalidate_cashflow(loan_pk)
+    return len(payments)
+
+
+def import_settlement(path, rejects_path, chunk_size=None, progress=None):
+    """
+    Imports a bank settlement file, committing every chunk_size loans, and
+    writes the rows it could not apply to rejects_path with the reason.
+
+    The file is streamed: rows are buffered per loan only until chunk_size
+    loans are pending, so memory is bounded by the chunk rather than the file.
+    Settlements are expected to be grouped by loan; rows for a loan whose
+    chunk was already committed are applied in a later chunk, as separate
+    MakePayment calls would be.
+
+    progress, if given, is called after each chunk with (loans done, rows
+    read). Returns counts of rows, imported payments and rejects.
+    """
+    chunk_size = chunk_size or settings.PAYMENT_IMPORT_CHUNK_SIZE
+    with open(rejects_path, "w", newline="") as rejects_file:
+        writer = csv.writer(rejects_file)
+        writer.writerow(REJECT_COLUMNS)
+        counts = {"rows": 0, "imported": 0, "rejected": 0}
+
+        def reject(row, reason):
+            writer.writerow((*row, reason))
+            counts["rejected"] += 1
+
+        loans_done = 0
+        pending = defaultdict(list)
+
+        def flush():
+            nonlocal loans_done
+            counts["imported"] += import_loan_payments(pending, reject)
+            loans_done += len(pending)
+            pending.clear()
+            if progress:
+                progress(loans_done, counts["rows"])
+
+        def reject_unreadable(row, reason):
+            counts["rows"] += 1
+            reject(row, reason)
+
+        rows = read_settlement(path, reject_unreadable)
+        for loan_id, payment_date, amount, row in rows:
+            if loan_id not in pending and len(pending) >= chunk_size:
+                flush()
+            pending[loan_id].append((payment_date, amount, row))
+            counts["rows"] += 1
+        if pending:
+            flush()
+    return counts
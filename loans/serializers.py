@@ -1,19 +1,64 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef
 from rest_framework import serializers
-from .models import User, LoanApplication, Payment
+from .models import User, LoanApplication, LoanStatement, Installment, Payment
 from datetime import datetime, timedelta
-from decimal import Decimal, getcontext
-from .utils import calculate_emi, payment_handler
+from .cashflow import invalidate_cashflow
+from .instrumentation import timed
+from .money import from_paise, max_emi_paise, to_paise
+from .eligibility import MAX_TERM_PERIOD, MIN_INTEREST_RATE, evaluate_applications
+from .statements import STATEMENT_SECTIONS, new_statement, record_payment
+from .utils import apply_payment
 
-getcontext().prec = 10
 
+class TimedValidation:
+    # Validation time is reported as the "validate" phase of the request
+    @timed("validate")
+    def is_valid(self, *args, **kwargs):
+        return super().is_valid(*args, **kwargs)
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(TimedValidation, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["aadhar_id", "name", "email_id", "annual_income"]
 
 
-class LoanApplicationSerializer(serializers.ModelSerializer):
+class UserListSerializer(TimedValidation, serializers.ListSerializer):
+    def validate(self, attrs):
+        # Uniqueness is checked for the whole batch at once instead of one
+        # query per user and field.
+        for field in ("aadhar_id", "email_id"):
+            values = [item[field] for item in attrs]
+            if len(set(values)) != len(values):
+                raise serializers.ValidationError(f"Duplicate {field} in request")
+            for start in range(0, len(values), 1000):
+                existing = User.objects.filter(
+                    **{f"{field}__in": values[start : start + 1000]}
+                ).values_list(field, flat=True)[:10]
+                if existing:
+                    raise serializers.ValidationError(
+                        f"Users with these {field} values already exist: "
+                        + ", ".join(existing)
+                    )
+        return attrs
+
+    def create(self, validated_data):
+        return User.objects.bulk_create(
+            [User(**item) for item in validated_data], batch_size=1000
+        )
+
+
+class BulkUserSerializer(UserSerializer):
+    class Meta(UserSerializer.Meta):
+        list_serializer_class = UserListSerializer
+        extra_kwargs = {
+            "aadhar_id": {"validators": []},
+            "email_id": {"validators": []},
+        }
+
+
+class LoanApplicationSerializer(TimedValidation, serializers.ModelSerializer):
     user = serializers.UUIDField()
     emi_dates = serializers.SerializerMethodField()
 
@@ -29,6 +74,9 @@ class LoanApplicationSerializer(serializers.ModelSerializer):
             "disbursement_date",
             "emi_dates",
         ]
+        # The EMI and schedule divide by the term, so a term below one month
+        # is a field error rather than a failed calculation
+        extra_kwargs = {"term_period": {"min_value": 1, "max_value": MAX_TERM_PERIOD}}
 
     def validate_disbursement_date(self, value):
         if value <= datetime.now().date():
@@ -38,87 +86,168 @@ class LoanApplicationSerializer(serializers.ModelSerializer):
         return value
 
     def create(self, validated_data):
-        user_id = validated_data.pop("user")
-        user = User.objects.get(unique_user_id=user_id)
-
-        # Convert loan_amount, interest_rate, and annual_income to float
-        loan_amount = float(validated_data["loan_amount"])
-        interest_rate = float(validated_data["interest_rate"])
-        annual_income = float(user.annual_income)
-        term_period = validated_data["term_period"]
-        disbursement_date = validated_data["disbursement_date"]
-
-        # Validate interest rate
-        if interest_rate < 14:
-            raise serializers.ValidationError("Interest rate should be >= 14%")
-
-        # Calculate EMI using the external function
-        emi_amount, emi_dates = calculate_emi(
-            loan_amount, interest_rate, term_period, disbursement_date
-        )
-
-        # Ensure EMI amount is at most 60% of user's monthly income
-        max_emi = annual_income / 12 * 0.6
-        if emi_amount > max_emi:
-            raise serializers.ValidationError(
-                "EMI amount exceeds 60% of the user's monthly income"
+        # ApplyLoan passes the user it already fetched and the schedule from
+        # its eligibility check via save(user=..., emi_dates=...)
+        user = validated_data.pop("user")
+        if not isinstance(user, User):
+            user = User.objects.get(unique_user_id=user)
+        emi_dates = validated_data.pop("emi_dates", None)
+        if emi_dates is None:
+            [error], [schedule] = evaluate_applications(
+                [{**validated_data, "user": user.unique_user_id}],
+                {user.unique_user_id: user},
             )
+            if error:
+                raise serializers.ValidationError(error)
+            _, emi_dates = schedule
 
-        # Calculate total interest earned
-        total_interest = emi_amount * term_period - loan_amount
-        if total_interest <= 10000:
-            raise serializers.ValidationError("Total interest earned should be > 10000")
-
-        validated_data["emi_dates"] = emi_dates
-        loan_application = LoanApplication.objects.create(user=user, **validated_data)
+        [loan_application] = create_loans([(user, validated_data, emi_dates)])
         return loan_application
 
     def get_emi_dates(self, obj):
-        return obj.emi_dates
-
-
-class PaymentSerializer(serializers.ModelSerializer):
+        return obj.upcoming_emis()
+
+
+def create_loans(applications):
+    """
+    Inserts accepted loans given as (user, validated_data, emi_dates) with
+    their installments and empty statements, one bulk insert per table
+    however many loans there are. Returns the loans with emi_dates set to
+    the schedule as created, so responses needn't re-read it.
+    """
+    loans = LoanApplication.objects.bulk_create(
+        [LoanApplication(**{**data, "user": user}) for user, data, _ in applications],
+        batch_size=1000,
+    )
+    Installment.objects.bulk_create(
+        [
+            Installment(loan=loan, due_date=emi["date"], amount_due=emi["amount_due"])
+            for loan, (_, _, emi_dates) in zip(loans, applications)
+            for emi in emi_dates
+        ],
+        batch_size=1000,
+    )
+    LoanStatement.objects.bulk_create(
+        [new_statement(loan) for loan in loans], batch_size=1000
+    )
+
+    # One invalidation per cash-flow chunk the new loans fall in
+    chunks = {loan.pk // settings.CASHFLOW_CHUNK_SIZE: loan.pk for loan in loans}
+    for loan_pk in chunks.values():
+        invalidate_cashflow(loan_pk)
+
+    for loan, (_, _, emi_dates) in zip(loans, applications):
+        loan.emi_dates = emi_dates
+    return loans
+
+
+class StatementQuerySerializer(TimedValidation, serializers.Serializer):
+    limit = serializers.IntegerField(
+        required=False, min_value=1, max_value=settings.STATEMENT_MAX_PAGE_SIZE
+    )
+    past_after = serializers.DateField(required=False)
+    upcoming_after = serializers.DateField(required=False)
+    section = serializers.ChoiceField(choices=STATEMENT_SECTIONS, required=False)
+    stream = serializers.ChoiceField(choices=["ndjson"], required=False)
+
+
+class OfferQuerySerializer(TimedValidation, serializers.Serializer):
+    interest_rate = serializers.FloatField(
+        required=False, min_value=MIN_INTEREST_RATE, max_value=100
+    )
+    term_period = serializers.IntegerField(
+        required=False, min_value=1, max_value=MAX_TERM_PERIOD
+    )
+
+
+class PaymentSerializer(TimedValidation, serializers.ModelSerializer):
     loan = serializers.UUIDField()
 
     class Meta:
         model = Payment
         fields = ["loan", "date", "amount"]
+        # Duplicates are checked in validate() and by the unique constraint
+        validators = []
 
     def validate(self, data):
+        # The loan, its user (for max_emi in create) and both checks below
+        # come back from a single query, which also locks the loan row until
+        # the payment is saved
         try:
-            loan = LoanApplication.objects.get(loan_id=data["loan"])
+            loan = (
+                LoanApplication.objects.select_for_update(of=("self",))
+                .select_related("user")
+                .annotate(
+                    has_payment_on_date=Exists(
+                        Payment.objects.filter(loan=OuterRef("pk"), date=data["date"])
+                    ),
+                    has_previous_due=Exists(
+                        Installment.objects.filter(
+                            loan=OuterRef("pk"), due_date__lt=data["date"], paid=False
+                        )
+                    ),
+                )
+                .get(loan_id=data["loan"])
+            )
             data["loan"] = loan
         except LoanApplication.DoesNotExist:
             raise serializers.ValidationError("Invalid loan ID")
 
         # Check for duplicate payment
-        if Payment.objects.filter(loan=loan, date=data["date"]).exists():
+        if loan.has_payment_on_date:
             raise serializers.ValidationError(
                 "A payment for this loan on this date already exists"
             )
 
         # Check for previous EMIs due
-        emi_dates = loan.emi_dates
-        for emi in emi_dates:
-            if emi["date"] < str(data["date"]) and emi["amount_due"] > 0:
-                raise serializers.ValidationError("Previous EMIs are due")
+        if loan.has_previous_due:
+            raise serializers.ValidationError("Previous EMIs are due")
 
         return data
 
     def create(self, validated_data):
         loan = validated_data.pop("loan")
         payment_date = validated_data["date"]
-        payment_amount = float(validated_data["amount"])
-
-        # Register the payment
-        payment = Payment.objects.create(loan=loan, **validated_data)
-
-        # Adjust EMI dates using payment_handler
-        max_emi = float(loan.user.annual_income) / 12 * 0.6
-        loan.emi_dates = payment_handler(
-            loan.emi_dates, payment_date, payment_amount, max_emi
+        payment_amount = to_paise(validated_data["amount"])
+
+        # The payment is inserted by record_payment once its principal and
+        # interest split is known
+        payment = Payment(loan=loan, **validated_data)
+
+        # Apply the payment to the unpaid installments from the payment date
+        # on. Rows are streamed in due-date order and only read as far as
+        # the payment or the shortfall carry-forward reaches.
+        installments = (
+            loan.installments.filter(paid=False, due_date__gte=payment_date)
+            .values_list("id", "due_date", "amount_due")
+            .iterator(chunk_size=12)
+        )
+        # Amounts are applied in integer paise
+        max_emi = max_emi_paise(loan.user.annual_income)
+        delta = apply_payment(
+            (
+                (installment_id, due_date, to_paise(amount_due))
+                for installment_id, due_date, amount_due in installments
+            ),
+            payment_date,
+            payment_amount,
+            max_emi,
         )
 
-        loan.save()
+        # Write back only the installments the payment changed
+        changed = []
+        for installment_id, amount_due in delta.items():
+            changed.append(
+                Installment(
+                    id=installment_id,
+                    amount_due=from_paise(amount_due),
+                    paid=amount_due <= 0,
+                )
+            )
+        Installment.objects.bulk_update(changed, ["amount_due", "paid"])
+        invalidate_cashflow(loan.pk)
+
+        # Register the payment and advance the materialised statement
+        record_payment(loan, payment)
 
         return payment
@@ -0,0 +1,347 @@
+import hashlib
+import json
+import uuid
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import LoanStatement, Payment
+from .money import emi_paise, from_paise, interest_paise, rate_factors, to_paise
+
+
+def statement_cache_key(loan_id):
+    return f"statement:{loan_id}"
+
+
+def statement_generation_key(loan_id):
+    return f"statement-generation:{loan_id}"
+
+
+def invalidate_statements(loan_ids):
+    # Give each loan a new generation once the surrounding transaction
+    # commits. Statements are cached with the generation read before they
+    # were built, so a read that started before the commit and caches the
+    # pre-commit state afterwards is never served.
+    generations = {
+        statement_generation_key(loan_id): uuid.uuid4().hex for loan_id in loan_ids
+    }
+    transaction.on_commit(lambda: cache.set_many(generations, None))
+
+
+def invalidate_statement(loan_id):
+    invalidate_statements([loan_id])
+
+
+def emi_amount_for(loan):
+    factors = rate_factors(loan.interest_rate, loan.term_period)
+    return from_paise(emi_paise(to_paise(loan.loan_amount), factors))
+
+
+def new_statement(loan):
+    # New loans start with an empty statement so the first payment is an
+    # incremental step rather than a replay
+    return LoanStatement(
+        loan=loan,
+        emi_amount=emi_amount_for(loan),
+        remaining_principal=loan.loan_amount,
+    )
+
+
+def _apply_to_statement(statement, payment, factors):
+    # One step of the amortisation replay: the payment covers this month's
+    # interest on the remaining principal and the rest of the EMI.
+    remaining_principal = to_paise(statement.remaining_principal)
+    interest_for_month = interest_paise(remaining_principal, factors)
+    principal_for_month = to_paise(statement.emi_amount) - interest_for_month
+    statement.remaining_principal = from_paise(
+        remaining_principal - principal_for_month
+    )
+    statement.last_payment_date = payment.date
+    statement.payment_count += 1
+
+    payment.principal = from_paise(principal_for_month)
+    payment.interest = from_paise(interest_for_month)
+
+
+def rebuild_statement(loan):
+    # Full replay over every payment, used for loans without a statement
+    # yet and for back-dated payments that land before the cursor.
+    factors = rate_factors(loan.interest_rate, loan.term_period)
+    statement, _ = LoanStatement.objects.update_or_create(
+        loan=loan,
+        defaults={
+            "emi_amount": emi_amount_for(loan),
+            "remaining_principal": loan.loan_amount,
+            "last_payment_date": None,
+            "payment_count": 0,
+        },
+    )
+    payments = list(Payment.objects.filter(loan=loan).order_by("date"))
+    for payment in payments:
+        _apply_to_statement(statement, payment, factors)
+
+    Payment.objects.bulk_update(payments, ["principal", "interest"])
+    statement.save()
+    invalidate_statement(loan.loan_id)
+
+
+def record_payment(loan, payment):
+    # Saves the payment (new or existing) together with its split. Runs in
+    # the caller's transaction when there is one.
+    with transaction.atomic(savepoint=False):
+        statement = LoanStatement.objects.select_for_update().filter(loan=loan).first()
+        if statement is None or (
+            statement.last_payment_date is not None
+            and payment.date < statement.last_payment_date
+        ):
+            payment.save()
+            rebuild_statement(loan)
+            return
+
+        factors = rate_factors(loan.interest_rate, loan.term_period)
+        _apply_to_statement(statement, payment, factors)
+        payment.save()
+        statement.save()
+        invalidate_statement(loan.loan_id)
+
+
+def record_payments(payments):
+    """
+    Bulk counterpart of record_payment for imports: inserts new payments with
+    their splits and advances the statements of their loans with one query
+    per table. payments are unsaved, with loan set and in date order for
+    each loan. Loans without a statement or with a payment dated before
+    their statement's last one are replayed in full instead. Runs in the
+    caller's transaction.
+    """
+    loans = {payment.loan_id: payment.loan for payment in payments}
+    statements = {
+        statement.loan_id: statement
+        for statement in LoanStatement.objects.select_for_update().filter(
+            loan_id__in=loans
+        )
+    }
+
+    replay = set()
+    for payment in payments:
+        statement = statements.get(payment.loan_id)
+        if payment.loan_id in replay:
+            continue
+        if statement is None or (
+            statement.last_payment_date is not None
+            and payment.date < statement.last_payment_date
+        ):
+            replay.add(payment.loan_id)
+            continue
+        loan = loans[payment.loan_id]
+        factors = rate_factors(loan.interest_rate, loan.term_period)
+        _apply_to_statement(statement, payment, factors)
+
+    Payment.objects.bulk_create(payments, batch_size=1000)
+    LoanStatement.objects.bulk_update(
+        [
+            statement
+            for loan_pk, statement in statements.items()
+            if loan_pk not in replay
+        ],
+        ["remaining_principal", "last_payment_date", "payment_count"],
+        batch_size=1000,
+    )
+    for loan_pk in replay:
+        rebuild_statement(loans[loan_pk])
+
+    invalidate_statements([loan.loan_id for loan in loans.values()])
+
+
+def _past_transactions(loan, after=None):
+    payments = Payment.objects.filter(loan=loan).order_by("date")
+    if after is not None:
+        payments = payments.filter(date__gt=after)
+    return payments.values_list("date", "principal", "interest", "amount")
+
+
+def _past_transaction(date, principal, interest, amount):
+    return {
+        "date": date.strftime("%Y-%m-%d"),
+        "principal": float(principal),
+        "interest": float(interest),
+        "amount_paid": float(amount),
+    }
+
+
+def _upcoming_transactions(loan, after=None):
+    installments = loan.installments.filter(paid=False)
+    if after is not None:
+        installments = installments.filter(due_date__gt=after)
+    return installments.values_list("due_date", "amount_due")
+
+
+def _upcoming_transaction(due_date, amount_due):
+    return {"date": due_date.strftime("%Y-%m-%d"), "amount_due": float(amount_due)}
+
+
+def _unmaterialised_payments(loan):
+    # Payments recorded before statements were materialised have no split yet
+    return Payment.objects.filter(loan=loan, principal__isnull=True)
+
+
+def _ensure_materialised(loan):
+    if _unmaterialised_payments(loan).exists():
+        rebuild_statement(loan)
+
+
+def _statement(payments, installments):
+    body = {
+        "past_transactions": [_past_transaction(*payment) for payment in payments],
+        "upcoming_transactions": [
+            _upcoming_transaction(*installment) for installment in installments
+        ],
+    }
+    etag = hashlib.md5(json.dumps(body, default=str).encode()).hexdigest()
+    return {"etag": f'"{etag}"', "body": body}
+
+
+def build_statement(loan):
+    payments = list(_past_transactions(loan))
+    if any(principal is None for _, principal, _, _ in payments):
+        rebuild_statement(loan)
+        return build_statement(loan)
+    return _statement(payments, _upcoming_transactions(loan))
+
+
+async def abuild_statement(loan):
+    # build_statement for async views. Reads go through the async ORM; a
+    # rebuild writes in a transaction, so it runs in the ORM's sync thread.
+    payments = [row async for row in _past_transactions(loan)]
+    if any(principal is None for _, principal, _, _ in payments):
+        await sync_to_async(rebuild_statement)(loan)
+        return await abuild_statement(loan)
+    return _statement(payments, [row async for row in _upcoming_transactions(loan)])
+
+
+STATEMENT_SECTIONS = ("past_transactions", "upcoming_transactions")
+
+
+def statement_page(loan, limit, past_after=None, upcoming_after=None, section=None):
+    """
+    One page of each statement section, ordered by date. The next_*_cursor
+    values are passed back as past_after/upcoming_after to get the following
+    page and are None once a section is exhausted. Without a cursor a
+    section starts from its first row, so a client that keeps paging after
+    one section is done passes section to page through the other alone;
+    only that section and its cursor are returned then.
+    """
+    _ensure_materialised(loan)
+    page = {}
+    if section in (None, "past_transactions"):
+        payments = list(_past_transactions(loan, past_after)[: limit + 1])
+        page["past_transactions"] = [
+            _past_transaction(*row) for row in payments[:limit]
+        ]
+        page["next_past_cursor"] = (
+            payments[limit - 1][0].strftime("%Y-%m-%d")
+            if len(payments) > limit
+            else None
+        )
+    if section in (None, "upcoming_transactions"):
+        installments = list(_upcoming_transactions(loan, upcoming_after)[: limit + 1])
+        page["upcoming_transactions"] = [
+            _upcoming_transaction(*row) for row in installments[:limit]
+        ]
+        page["next_upcoming_cursor"] = (
+            installments[limit - 1][0].strftime("%Y-%m-%d")
+            if len(installments) > limit
+            else None
+        )
+    return page
+
+
+def stream_statement(loan):
+    """
+    Yields the statement as NDJSON, one transaction per line tagged with its
+    section. Rows are read with server-side chunking, so memory stays flat
+    however long the loan is.
+    """
+    _ensure_materialised(loan)
+    for row in _past_transactions(loan).iterator(chunk_size=500):
+        line = {"section": "past_transactions", **_past_transaction(*row)}
+        yield json.dumps(line) + "\n"
+    for row in _upcoming_transactions(loan).iterator(chunk_size=500):
+        line = {"section": "upcoming_transactions", **_upcoming_transaction(*row)}
+        yield json.dumps(line) + "\n"
+
+
+async def _aiterate(rows, chunk_size):
+    # QuerySet.aiterator() in Django 4.2 starts values_list queries on the
+    # event loop, so the iterator is created in the ORM's thread as well as
+    # read from there.
+    iterator = None
+
+    def next_chunk():
+        nonlocal iterator
+        if iterator is None:
+            iterator = rows.iterator(chunk_size=chunk_size)
+        return list(islice(iterator, chunk_size))
+
+    while chunk := await sync_to_async(next_chunk)():
+        for row in chunk:
+            yield row
+
+
+async def astream_statement(loan):
+    # stream_statement for async views, which Django streams without
+    # tying up a thread for the whole response
+    if await _unmaterialised_payments(loan).aexists():
+        await sync_to_async(rebuild_statement)(loan)
+    async for row in _aiterate(_past_transactions(loan), 500):
+        line = {"section": "past_transactions", **_past_transaction(*row)}
+        yield json.dumps(line) + "\n"
+    async for row in _aiterate(_upcoming_transactions(loan), 500):
+        line = {"section": "upcoming_transactions", **_upcoming_transaction(*row)}
+        yield json.dumps(line) + "\n"
+
+
+def _current(entries, loan_id):
+    # The cached statement if it was built in the loan's current generation
+    cached = entries.get(statement_cache_key(loan_id))
+    if cached is None:
+        return None
+    generation, statement = cached
+    if generation != entries.get(statement_generation_key(loan_id)):
+        return None
+    return statement
+
+
+def get_cached_statement(loan_id):
+    keys = [statement_cache_key(loan_id), statement_generation_key(loan_id)]
+    return _current(cache.get_many(keys), loan_id)
+
+
+def cache_statement(loan):
+    generation = cache.get(statement_generation_key(loan.loan_id))
+    statement = build_statement(loan)
+    cache.set(
+        statement_cache_key(loan.loan_id),
+        (generation, statement),
+        settings.STATEMENT_CACHE_TIMEOUT,
+    )
+    return statement
+
+
+async def aget_cached_statement(loan_id):
+    keys = [statement_cache_key(loan_id), statement_generation_key(loan_id)]
+    return _current(await cache.aget_many(keys), loan_id)
+
+
+async def acache_statement(loan):
+    generation = await cache.aget(statement_generation_key(loan.loan_id))
+    statement = await abuild_statement(loan)
+    await cache.aset(
+        statement_cache_key(loan.loan_id),
+        (generation, statement),
+        settings.STATEMENT_CACHE_TIMEOUT,
+    )
+    return statement
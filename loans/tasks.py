@@ -1,45 +1,193 @@
+from datetime import date
+import time
+
 from celery import shared_task
+from celery.signals import task_postrun, task_prerun, worker_process_init
+from django.conf import settings
+from django.core.cache import cache
+from django.dispatch import receiver
+from .balance_cache import balance_cache
+from .delinquency import open_loan_id_ranges, process_loan_range, reset_snapshot
 from .models import User
-import pandas as pd
+from .offers import invalidate_offers
+from .transactions import (
+    balances_changed,
+    credit_score_for_balance,
+    credit_scores_for_balances,
+    ensure_balance_index,
+    get_user_balances,
+)
 import logging
 
+logger = logging.getLogger(__name__)
+
+# perf_counter() at the start of each running task, by task ID
+task_started = {}
+
+
+@worker_process_init.connect
+def warm_balance_cache(**kwargs):
+    # Each pool process loads the balances once, before its first task
+    balance_cache.load()
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, **kwargs):
+    task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def log_task_timing(task_id=None, task=None, state=None, **kwargs):
+    started = task_started.pop(task_id, None)
+    if started is None:
+        return
+    logger.info(
+        "Task finished",
+        extra={
+            "task": task.name,
+            "task_id": task_id,
+            "state": state,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        },
+    )
+
 
 @shared_task
 def calculate_credit_score(aadhar_id):
     user = User.objects.get(aadhar_id=aadhar_id)
-    transactions = pd.read_csv("data/transactions_data_backend__1_.csv")
-    logging.info(f"Loaded transactions: {transactions.head()}")
 
-    # Filter transactions for the specific user by aadhar_id
-    user_transactions = transactions[transactions["user"] == str(user.aadhar_id)]
-    logging.info(f"Filtered transactions for user {aadhar_id}: {user_transactions}")
+    # Per-user balances are precomputed once per version of the transaction
+    # file and held by the worker process, so scoring is a dictionary lookup
+    # instead of a full CSV scan.
+    total_balance = balance_cache.get(user.aadhar_id)
 
-    if user_transactions.empty:
-        logging.info(
-            f"No transactions found for user {aadhar_id}. Setting default credit score."
+    if total_balance is None:
+        logger.debug(
+            "No transactions found, using the default credit score",
+            extra={"aadhar_id": aadhar_id},
         )
         # No transactions found for the user, set credit score to default
         user.credit_score = 300
         user.save()
+        invalidate_offers([user.unique_user_id])
         return
 
-    # Calculate total balance from user transactions
-    total_balance = user_transactions.apply(
-        lambda x: x["amount"] if x["transaction_type"] == "CREDIT" else -x["amount"],
-        axis=1,
-    ).sum()
-    logging.info(f"Total balance for user {aadhar_id}: {total_balance}")
-
     # Determine credit score based on total balance
-    if total_balance >= 1000000:
-        credit_score = 900
-    elif total_balance <= 100000:
-        credit_score = 300
-    else:
-        credit_score = 300 + ((total_balance - 100000) // 15000) * 10
+    credit_score = credit_score_for_balance(total_balance)
 
-    logging.info(f"Calculated credit score for user {aadhar_id}: {credit_score}")
+    logger.debug(
+        "Calculated credit score",
+        extra={
+            "aadhar_id": aadhar_id,
+            "balance": total_balance,
+            "credit_score": credit_score,
+        },
+    )
 
     # Update user's credit score
     user.credit_score = credit_score
     user.save()
+    invalidate_offers([user.unique_user_id])
+
+
+@shared_task
+def calculate_credit_scores(aadhar_ids):
+    # Batch variant of calculate_credit_score: one cache lookup, one
+    # vectorised scoring pass and one bulk_update for the whole batch.
+    users = list(
+        User.objects.filter(aadhar_id__in=aadhar_ids).only(
+            "id", "aadhar_id", "unique_user_id"
+        )
+    )
+    balances = balance_cache.get_many([user.aadhar_id for user in users])
+
+    # Users without transactions get the default score of 300
+    credit_scores = credit_scores_for_balances(
+        [balances.get(user.aadhar_id, 0) for user in users]
+    )
+    for user, credit_score in zip(users, credit_scores):
+        user.credit_score = int(credit_score)
+
+    User.objects.bulk_update(users, ["credit_score"], batch_size=1000)
+    invalidate_offers([user.unique_user_id for user in users])
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Calculated credit scores",
+            extra={"users": len(users), **balance_cache.stats()},
+        )
+
+
+@shared_task
+def run_delinquency_batch(as_of=None):
+    # Nightly entry point (see CELERY_BEAT_SCHEDULE). Open loans are fanned
+    # out to the worker pool in keyset-paginated chunks, each of which adds
+    # its share to the day's DelinquencySnapshot rows.
+    as_of = date.fromisoformat(as_of) if as_of else date.today()
+    reset_snapshot(as_of)
+    chunks = 0
+    for first_id, last_id in open_loan_id_ranges(settings.DELINQUENCY_BATCH_SIZE):
+        process_delinquency_chunk.delay(first_id, last_id, as_of.isoformat())
+        chunks += 1
+    logger.info(
+        "Delinquency batch dispatched", extra={"as_of": as_of, "chunks": chunks}
+    )
+
+
+@shared_task
+def process_delinquency_chunk(first_id, last_id, as_of):
+    process_loan_range(first_id, last_id, date.fromisoformat(as_of))
+
+
+def score_refresh_key(aadhar_id):
+    return f"credit-score:pending:{aadhar_id}"
+
+
+@receiver(balances_changed)
+def schedule_score_refresh(aadhar_ids, **kwargs):
+    # The first change to a user's balance in a window queues a refresh due
+    # at the end of the window; later changes find the pending key and are
+    # picked up by that same refresh. The key outlives the window so that a
+    # lost task only delays the next refresh instead of blocking it.
+    window = settings.CREDIT_SCORE_REFRESH_WINDOW
+    pending = [
+        aadhar_id
+        for aadhar_id in aadhar_ids
+        if cache.add(score_refresh_key(aadhar_id), True, window * 2)
+    ]
+    batch_size = settings.CREDIT_SCORE_BATCH_SIZE
+    for start in range(0, len(pending), batch_size):
+        refresh_credit_scores.apply_async(
+            (pending[start : start + batch_size],), countdown=window
+        )
+
+
+@shared_task
+def refresh_credit_scores(aadhar_ids):
+    # Rescores users whose balance changed from their UserBalance rows, which
+    # ingestion keeps as running totals, instead of the transaction history.
+    # The pending keys are cleared before reading, so a change committed
+    # after the read queues a new refresh rather than being lost.
+    cache.delete_many([score_refresh_key(aadhar_id) for aadhar_id in aadhar_ids])
+    ensure_balance_index()
+    balances = get_user_balances(aadhar_ids)
+
+    users = list(
+        User.objects.filter(aadhar_id__in=aadhar_ids).only(
+            "id", "aadhar_id", "unique_user_id", "credit_score"
+        )
+    )
+    credit_scores = credit_scores_for_balances(
+        [balances.get(user.aadhar_id, 0) for user in users]
+    )
+    changed = []
+    for user, credit_score in zip(users, credit_scores):
+        if user.credit_score != credit_score:
+            user.credit_score = int(credit_score)
+            changed.append(user)
+
+    User.objects.bulk_update(changed, ["credit_score"], batch_size=1000)
+    invalidate_offers([user.unique_user_id for user in changed])
+    logger.info(
+        "Refreshed credit scores",
+        extra={"users": len(users), "changed": len(changed)},
+    )
@@ -1,3 +1,1362 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import logging
+import os
+import runpy
+import shutil
+import tempfile
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from fractions import Fraction
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.test import (
+    Client,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+
+from loan_management_system import settings as settings_module
+from loan_management_system.celery import app as celery_app
+
+from . import statements
+from .backends.sqlite3.base import DatabaseWrapper
+from .balance_cache import BalanceCache
+from .delinquency import process_loan_range, reset_snapshot
+from .instrumentation import metrics
+from .log import QueueListenerHandler, SampleDebugFilter, StructuredFormatter
+from .models import (
+    DelinquencySnapshot,
+    Installment,
+    LoanApplication,
+    LoanStatement,
+    Payment,
+    TransactionFile,
+    User,
+    UserBalance,
+)
+from . import cashflow, offers, payment_import
+from .payment_import import import_settlement
+from .tasks import (
+    calculate_credit_score,
+    calculate_credit_scores,
+    log_task_timing,
+    process_delinquency_chunk,
+    refresh_credit_scores,
+    run_delinquency_batch,
+    start_task_timer,
+)
+from .transaction_store import build_store, current_store, get_store, read_current
+from .transactions import ensure_balance_index, ingest_files
+from .utils import apply_payment, calculate_emi, payment_handler
+
+
+class LoanFixtureMixin:
+    """
+    Alice, who qualifies for a loan, created once per class, and the Car
+    loan the tests apply for on her behalf.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            aadhar_id="f5abc955-889d-4a17-87b9-45b362eb673b",
+            name="Alice",
+            email_id="alice@example.com",
+            annual_income=1200000,
+            credit_score=700,
+        )
+        cls.application = {
+            "user": str(cls.user.unique_user_id),
+            "loan_type": "Car",
+            "loan_amount": 500000,
+            "interest_rate": 15,
+            "term_period": 20,
+            "disbursement_date": str(date.today() + timedelta(days=10)),
+        }
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def post_loan(self, **overrides):
+        return self.client.post(
+            "/api/apply-loan/",
+            {**self.application, **overrides},
+            content_type="application/json",
+        )
+
+    def apply_loan(self, **overrides):
+        response = self.post_loan(**overrides)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+
+class QueryCountTests(LoanFixtureMixin, TestCase):
+    """Pins the number of queries per endpoint so regressions show up."""
+
+    def make_payment(self, loan_id, payment_date, amount, **headers):
+        return self.client.post(
+            "/api/make-payment/",
+            {"loan": loan_id, "date": payment_date, "amount": amount},
+            content_type="application/json",
+            **headers,
+        )
+
+    def test_register_user(self):
+        with mock.patch("loans.views.calculate_credit_score.delay") as delay:
+            # Two uniqueness checks and the insert
+            with self.assertNumQueries(3):
+                response = self.client.post(
+                    "/api/register-user/",
+                    {
+                        "aadhar_id": "b7fa4071-5883-4ac6-830e-4bb5a4cd7826",
+                        "name": "Bob",
+                        "email_id": "bob@example.com",
+                        "annual_income": 700000,
+                    },
+                    content_type="application/json",
+                )
+        self.assertEqual(response.status_code, 200)
+        delay.assert_called_once_with("b7fa4071-5883-4ac6-830e-4bb5a4cd7826")
+
+    def test_apply_loan(self):
+        # User lookup and inserts of the loan, its installments (one bulk
+        # insert) and its empty statement
+        with self.assertNumQueries(4):
+            loan = self.apply_loan()
+        self.assertEqual(len(loan["due_dates"]), 20)
+
+    def test_apply_loans(self):
+        poor = User.objects.create(
+            aadhar_id="0d3c5a34-6c3f-4bd6-9d47-8b3a5e1f2c10",
+            name="Carol",
+            email_id="carol@example.com",
+            annual_income=100000,
+            credit_score=700,
+        )
+        application = self.application
+        batch = [
+            application,
+            {**application, "user": "00000000-0000-4000-8000-000000000000"},
+            {**application, "user": str(poor.unique_user_id)},
+            {**application, "loan_amount": 900000},
+            {**application, "interest_rate": 12},
+            {**application, "loan_amount": 2000000, "loan_type": "Home"},
+            {**application, "loan_type": "Boat"},
+            {**application, "term_period": 60},
+            {**application, "term_period": 0},
+            {**application, "term_period": -12},
+        ]
+        # Users in one query, then the loans, installments and statements of
+        # the accepted applications in one insert each, inside a savepoint
+        with self.assertNumQueries(6):
+            response = self.client.post(
+                "/api/apply-loans/", batch, content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual(
+            [result["error"] for result in results[1:6]],
+            [
+                "User does not exist",
+                "User does not meet the criteria for loan application",
+                "Loan amount exceeds the limit for the selected loan type",
+                "Interest rate should be >= 14%",
+                "EMI amount exceeds 60% of the user's monthly income",
+            ],
+        )
+        self.assertIn("loan_type", results[6]["error"])
+        for result in results[8:]:
+            self.assertIn("term_period", result["error"])
+
+        # Accepted loans match what the single endpoint creates
+        single = self.apply_loan()
+        self.assertEqual(results[0]["due_dates"], single["due_dates"])
+        self.assertEqual(len(results[7]["due_dates"]), 60)
+        self.assertEqual(
+            Installment.objects.filter(loan__loan_id=results[7]["loan_id"]).count(), 60
+        )
+        self.assertEqual(LoanApplication.objects.count(), 3)
+
+        with self.settings(LOAN_APPLICATION_BATCH_MAX_SIZE=2):
+            too_many = self.client.post(
+                "/api/apply-loans/", batch[:3], content_type="application/json"
+            )
+        self.assertEqual(too_many.status_code, 400)
+        self.assertEqual(LoanApplication.objects.count(), 3)
+
+    def test_make_payment(self):
+        loan = self.apply_loan()
+        first, second = loan["due_dates"][0]["date"], loan["due_dates"][1]["date"]
+
+        # Locking loan fetch with both validation checks, installment read
+        # and update, statement lookup, payment insert and statement update.
+        # The view's transaction shows up as a savepoint inside TestCase.
+        with self.assertNumQueries(8):
+            response = self.make_payment(loan["loan_id"], first, 20000)
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(8):
+            response = self.make_payment(loan["loan_id"], second, 40000)
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(3):
+            response = self.make_payment(loan["loan_id"], second, 40000)
+        self.assertEqual(response.status_code, 400)
+
+    def test_make_payment_idempotency_key(self):
+        loan = self.apply_loan()
+        payment_date = loan["due_dates"][0]["date"]
+
+        response = self.make_payment(
+            loan["loan_id"], payment_date, 20000, HTTP_IDEMPOTENCY_KEY="retry-1"
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # A retry is answered from the cache without running the view
+        with self.assertNumQueries(0):
+            retry = self.make_payment(
+                loan["loan_id"], payment_date, 20000, HTTP_IDEMPOTENCY_KEY="retry-1"
+            )
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+
+        reused = self.make_payment(
+            loan["loan_id"], payment_date, 30000, HTTP_IDEMPOTENCY_KEY="retry-1"
+        )
+        self.assertEqual(reused.status_code, 422)
+
+    def test_idempotency_key_held_briefly_while_running(self):
+        loan = self.apply_loan()
+        with mock.patch(
+            "loans.idempotency.cache.add", wraps=cache.add
+        ) as add, mock.patch("loans.idempotency.cache.set", wraps=cache.set) as set_:
+            self.make_payment(
+                loan["loan_id"],
+                loan["due_dates"][0]["date"],
+                20000,
+                HTTP_IDEMPOTENCY_KEY="retry-2",
+            )
+        self.assertEqual(add.call_args.args[2], 60)
+        self.assertEqual(set_.call_args.args[2], 24 * 60 * 60)
+
+    def test_idempotency_key_expiring_mid_claim_is_not_run_twice(self):
+        loan = self.apply_loan()
+        # The holder's marker expires between add and get, and a concurrent
+        # retry claims the key before this one can
+        with mock.patch("loans.idempotency.cache.add", return_value=False), mock.patch(
+            "loans.idempotency.cache.get", return_value=None
+        ):
+            response = self.make_payment(
+                loan["loan_id"],
+                loan["due_dates"][0]["date"],
+                20000,
+                HTTP_IDEMPOTENCY_KEY="retry-3",
+            )
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_portfolio_cashflow(self):
+        loan = self.apply_loan()
+        url = "/api/portfolio/cashflow/"
+
+        # Last loan id, then the chunk's loans and installments
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        rows = response.json()["cashflow"]
+        self.assertEqual(len(rows), 20)
+        self.assertEqual({row["loan_type"] for row in rows}, {"Car"})
+        expected = sum(Decimal(str(emi["amount_due"])) for emi in loan["due_dates"])
+        self.assertEqual(
+            sum(Decimal(str(row["expected_amount"])) for row in rows), expected
+        )
+        self.assertEqual(
+            sum(Decimal(str(row["principal"])) for row in rows), Decimal(500000)
+        )
+
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        # A payment only invalidates its own chunk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_payment(loan["loan_id"], loan["due_dates"][0]["date"], 20000)
+        rows = self.client.get(url).json()["cashflow"]
+        self.assertEqual(len(rows), 19)
+
+    def test_cashflow_projected_before_payment_is_not_served(self):
+        loan = self.apply_loan()
+        url = "/api/portfolio/cashflow/"
+        project_chunk = cashflow.project_chunk
+
+        def project_then_pay(chunk):
+            # The payment commits after the chunk is read but before it and
+            # the portfolio are cached
+            totals = project_chunk(chunk)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.make_payment(loan["loan_id"], loan["due_dates"][0]["date"], 20000)
+            return totals
+
+        with mock.patch("loans.cashflow.project_chunk", project_then_pay):
+            stale = self.client.get(url)
+        self.assertEqual(len(stale.json()["cashflow"]), 20)
+        self.assertEqual(len(self.client.get(url).json()["cashflow"]), 19)
+
+    def test_get_statement(self):
+        loan = self.apply_loan()
+        self.make_payment(loan["loan_id"], loan["due_dates"][0]["date"], 20000)
+        url = f"/api/get-statement/{loan['loan_id']}/"
+
+        # Loan, payments and installments on a cache miss
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["past_transactions"]), 1)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual(cached.json(), response.json())
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_statement_built_before_payment_is_not_served(self):
+        loan = self.apply_loan()
+        url = f"/api/get-statement/{loan['loan_id']}/"
+        build_statement = statements.build_statement
+
+        def build_then_pay(loan_application):
+            # The payment commits after the statement is read but before it
+            # is cached
+            statement = build_statement(loan_application)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.make_payment(loan["loan_id"], loan["due_dates"][0]["date"], 20000)
+            return statement
+
+        with mock.patch("loans.statements.build_statement", build_then_pay):
+            stale = self.client.get(url)
+        self.assertEqual(stale.json()["past_transactions"], [])
+        self.assertIsNone(statements.get_cached_statement(loan["loan_id"]))
+        self.assertEqual(len(self.client.get(url).json()["past_transactions"]), 1)
+
+    def test_statement_pages_and_stream(self):
+        loan = self.apply_loan()
+        due_dates = [due["date"] for due in loan["due_dates"]]
+        for due_date in due_dates[:3]:
+            response = self.make_payment(loan["loan_id"], due_date, 20000)
+            self.assertEqual(response.status_code, 200)
+        url = f"/api/get-statement/{loan['loan_id']}/"
+
+        page = self.client.get(url, {"limit": 2}).json()
+        self.assertEqual(
+            [row["date"] for row in page["past_transactions"]], due_dates[:2]
+        )
+        self.assertEqual(
+            [row["date"] for row in page["upcoming_transactions"]], due_dates[3:5]
+        )
+        self.assertEqual(page["next_past_cursor"], due_dates[1])
+        self.assertEqual(page["next_upcoming_cursor"], due_dates[4])
+
+        page = self.client.get(
+            url,
+            {"limit": 2, "past_after": due_dates[1], "section": "past_transactions"},
+        ).json()
+        self.assertEqual(
+            page,
+            {
+                "past_transactions": [mock.ANY],
+                "next_past_cursor": None,
+            },
+        )
+        self.assertEqual(page["past_transactions"][0]["date"], due_dates[2])
+
+        # Paging one section until its cursor runs out ends
+        upcoming, params = [], {"limit": 5, "section": "upcoming_transactions"}
+        while True:
+            page = self.client.get(url, params).json()
+            upcoming += [row["date"] for row in page["upcoming_transactions"]]
+            if page["next_upcoming_cursor"] is None:
+                break
+            params["upcoming_after"] = page["next_upcoming_cursor"]
+        self.assertEqual(upcoming, due_dates[3:])
+
+        for limit in (0, 501):
+            response = self.client.get(url, {"limit": limit})
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {"section": "fees"})
+        self.assertEqual(response.status_code, 400)
+
+        stream = self.client.get(url, {"stream": "ndjson"})
+        self.assertEqual(stream["Content-Type"], "application/x-ndjson")
+        lines = [
+            json.loads(line) for line in b"".join(stream.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            [(line["section"], line["date"]) for line in lines],
+            [("past_transactions", due_date) for due_date in due_dates[:3]]
+            + [("upcoming_transactions", due_date) for due_date in due_dates[3:]],
+        )
+
+
+class RegisterUsersTests(TestCase):
+    def setUp(self):
+        self.users = [
+            {
+                "aadhar_id": f"aadhar-{index}",
+                "name": f"User {index}",
+                "email_id": f"user-{index}@example.com",
+                "annual_income": 700000,
+            }
+            for index in range(5)
+        ]
+
+    def register(self, users):
+        with mock.patch("loans.views.calculate_credit_scores.delay") as delay:
+            response = self.client.post(
+                "/api/register-users/", users, content_type="application/json"
+            )
+        return response, delay
+
+    def test_registers_batch_and_scores_in_chunks(self):
+        with self.settings(CREDIT_SCORE_BATCH_SIZE=2):
+            response, delay = self.register(self.users)
+        self.assertEqual(response.status_code, 200)
+        created = response.json()
+        self.assertEqual(
+            [user["aadhar_id"] for user in created],
+            [user["aadhar_id"] for user in self.users],
+        )
+        self.assertEqual(
+            {str(user.unique_user_id) for user in User.objects.all()},
+            {user["unique_user_id"] for user in created},
+        )
+        self.assertEqual(
+            delay.call_args_list,
+            [
+                mock.call(["aadhar-0", "aadhar-1"]),
+                mock.call(["aadhar-2", "aadhar-3"]),
+                mock.call(["aadhar-4"]),
+            ],
+        )
+
+    def test_rejects_duplicates_within_request(self):
+        for field in ("aadhar_id", "email_id"):
+            users = [*self.users, {**self.users[1], "name": "Copy"}]
+            if field == "aadhar_id":
+                users[-1]["email_id"] = "copy@example.com"
+            else:
+                users[-1]["aadhar_id"] = "aadhar-copy"
+            response, delay = self.register(users)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(
+                response.json(), {"non_field_errors": [f"Duplicate {field} in request"]}
+            )
+            delay.assert_not_called()
+        self.assertFalse(User.objects.exists())
+
+    def test_rejects_existing_users(self):
+        User.objects.create(**self.users[2])
+        response, delay = self.register(self.users)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {
+                "non_field_errors": [
+                    "Users with these aadhar_id values already exist: aadhar-2"
+                ]
+            },
+        )
+        delay.assert_not_called()
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_rejects_body_that_is_not_a_list(self):
+        response, delay = self.register(self.users[0])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("non_field_errors", response.json())
+        delay.assert_not_called()
+        self.assertFalse(User.objects.exists())
+
+
+class ScheduleTests(TestCase):
+    def assertSettles(self, loan_amount, interest_rate, term_period):
+        # Replaying the schedule with exact interest leaves under half a paisa
+        emi_amount, emi_dates = calculate_emi(
+            loan_amount, interest_rate, term_period, date(2025, 1, 5)
+        )
+        rate = Fraction(Decimal(str(interest_rate))) / 1200
+        balance = Fraction(Decimal(loan_amount))
+        for emi in emi_dates:
+            self.assertIsInstance(emi["amount_due"], Decimal)
+            balance = balance * (1 + rate) - Fraction(emi["amount_due"])
+        self.assertLessEqual(abs(balance), Fraction(1, 200))
+        return emi_amount, emi_dates
+
+    def test_large_home_loan_keeps_every_paisa(self):
+        emi_amount, emi_dates = self.assertSettles("8500000.55", 14.5, 360)
+        self.assertEqual(emi_amount, Decimal("104087.26"))
+        self.assertEqual(len(emi_dates), 360)
+
+    def test_last_emi_settles_rounding(self):
+        emi_amount, emi_dates = self.assertSettles("100000", 24, 12)
+        self.assertEqual(emi_dates[-1]["amount_due"], emi_amount)
+
+
+class PaymentApplicationTests(SimpleTestCase):
+    """apply_payment and payment_handler on four EMIs of 100, max EMI 150."""
+
+    def setUp(self):
+        self.emi_dates = [
+            {"date": f"2025-0{month}-05", "amount_due": Decimal(100)}
+            for month in (1, 2, 3, 4)
+        ]
+
+    def pay(self, amount, emi_dates=None, payment_date=date(2025, 1, 5)):
+        return [
+            (emi["date"], emi["amount_due"])
+            for emi in payment_handler(
+                emi_dates or self.emi_dates, payment_date, Decimal(amount), 150
+            )
+        ]
+
+    def test_exact_payment(self):
+        installments = [
+            (index, date.fromisoformat(emi["date"]), emi["amount_due"])
+            for index, emi in enumerate(self.emi_dates)
+        ]
+        # Later installments are not read once the payment is settled
+        consumed = iter(installments)
+        self.assertEqual(
+            apply_payment(consumed, date(2025, 1, 5), Decimal(100), 150), {0: 0}
+        )
+        self.assertEqual(next(consumed)[0], 2)
+        self.assertEqual(
+            self.pay(100),
+            [("2025-02-05", 100), ("2025-03-05", 100), ("2025-04-05", 100)],
+        )
+
+    def test_overpayment_spills_into_later_emis(self):
+        self.assertEqual(self.pay(250), [("2025-03-05", 50), ("2025-04-05", 100)])
+
+    def test_shortfall_carried_forward(self):
+        self.assertEqual(
+            self.pay(60),
+            [("2025-02-05", 140), ("2025-03-05", 100), ("2025-04-05", 100)],
+        )
+
+    def test_shortfall_capped_at_max_emi(self):
+        self.assertEqual(
+            self.pay(20),
+            [("2025-02-05", 150), ("2025-03-05", 130), ("2025-04-05", 100)],
+        )
+
+    def test_shortfall_on_final_emi_stays_on_it(self):
+        self.assertEqual(
+            self.pay(60, self.emi_dates[3:], date(2025, 4, 5)),
+            [("2025-04-05", 40)],
+        )
+
+
+class DelinquencyBatchTests(TestCase):
+    def setUp(self):
+        self.as_of = date(2025, 6, 15)
+        user = User.objects.create(
+            aadhar_id="9d7c1d3e-0b7a-4d8e-9d43-1f3b2a6c5e10",
+            name="Carol",
+            email_id="carol@example.com",
+            annual_income=1200000,
+            credit_score=700,
+        )
+        self.late, self.paid_off = [
+            LoanApplication.objects.create(
+                user=user,
+                loan_type=loan_type,
+                loan_amount=100000,
+                interest_rate=15,
+                term_period=3,
+                disbursement_date=date(2025, 3, 10),
+            )
+            for loan_type in ("Car", "Home")
+        ]
+        for loan in (self.late, self.paid_off):
+            Installment.objects.bulk_create(
+                [
+                    Installment(
+                        loan=loan, due_date=date(2025, month, 1), amount_due=100
+                    )
+                    for month in (4, 5, 6, 7)
+                ]
+            )
+        self.paid_off.installments.update(paid=True)
+        self.late.installments.filter(due_date__lt=date(2025, 5, 1)).update(paid=True)
+
+    def test_flags_closes_and_aggregates(self):
+        reset_snapshot(self.as_of)
+        process_loan_range(self.late.id, self.paid_off.id, self.as_of)
+
+        self.paid_off.refresh_from_db()
+        self.assertTrue(self.paid_off.is_closed)
+        self.assertEqual(
+            list(
+                self.late.installments.filter(overdue=True).values_list(
+                    "due_date", flat=True
+                )
+            ),
+            [date(2025, 5, 1), date(2025, 6, 1)],
+        )
+
+        rows = DelinquencySnapshot.objects.filter(date=self.as_of, loan_count__gt=0)
+        self.assertEqual(
+            list(
+                rows.values_list("loan_type", "bucket", "loan_count", "overdue_amount")
+            ),
+            [("Car", "31-60", 1, Decimal("200.00"))],
+        )
+
+    def test_redelivered_chunk_counts_once(self):
+        reset_snapshot(self.as_of)
+        for _ in range(2):
+            process_delinquency_chunk(self.late.id, self.late.id, "2025-06-15")
+        self.assertEqual(
+            DelinquencySnapshot.objects.get(
+                date=self.as_of, loan_type="Car", bucket="31-60"
+            ).loan_count,
+            1,
+        )
+
+        # Rerunning the batch for the day starts the ranges over
+        reset_snapshot(self.as_of)
+        process_delinquency_chunk(self.late.id, self.late.id, "2025-06-15")
+        self.assertEqual(
+            DelinquencySnapshot.objects.filter(date=self.as_of).aggregate(
+                loans=Sum("loan_count")
+            )["loans"],
+            1,
+        )
+
+    def test_dispatches_keyset_chunks(self):
+        with self.settings(DELINQUENCY_BATCH_SIZE=1), mock.patch(
+            "loans.tasks.process_delinquency_chunk.delay"
+        ) as delay:
+            run_delinquency_batch(self.as_of.isoformat())
+        self.assertEqual(
+            delay.call_args_list,
+            [
+                mock.call(loan.id, loan.id, "2025-06-15")
+                for loan in (self.late, self.paid_off)
+            ],
+        )
+        self.assertEqual(
+            DelinquencySnapshot.objects.filter(date=self.as_of).count(), 20
+        )
+
+
+class TransactionStoreTests(TestCase):
+    def test_balances_from_user_slices(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = Path(directory) / "transactions.csv"
+            source.write_text(
+                "user,date,transaction_type,amount\n"
+                "b,2021-01-02,CREDIT,500\n"
+                "a,2021-01-01,CREDIT,1000.50\n"
+                "b,2021-01-01,DEBIT,200\n"
+                "a,2021-01-03,DEBIT,0.25\n"
+                "b,not-a-date,CREDIT,5\n"
+                "b,2021-01-03,REFUND,5\n"
+                "a,2021-01-04,CREDIT,-10\n"
+                f"{'c' * 37},2021-01-04,CREDIT,10\n"
+            )
+            # Rows ingest_file would drop are left out
+            self.assertEqual(build_store(source, Path(directory) / "store"), 4)
+
+            store = get_store(Path(directory) / "store")
+            self.assertEqual(store.user_rows("a"), (0, 2))
+            self.assertEqual(store.balance("a"), Decimal("1000.25"))
+            self.assertEqual(store.balances(["b", "c"]), {"b": Decimal("300.00")})
+            # Rows of a user are in date order
+            start, stop = store.user_rows("b")
+            self.assertEqual(
+                store.columns["date"][start:stop].tolist(),
+                [date(2021, 1, 1), date(2021, 1, 2)],
+            )
+
+    def test_relative_source_is_current(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = Path(directory) / "transactions.csv"
+            source.write_text(
+                "user,date,transaction_type,amount\n" "a,2021-01-01,CREDIT,10\n"
+            )
+            with override_settings(
+                TRANSACTIONS_FILE=str(source),
+                TRANSACTION_STORE_DIR=str(Path(directory) / "store"),
+            ):
+                build_store(os.path.relpath(source))
+                self.assertEqual(current_store().balance("a"), Decimal("10.00"))
+
+    def test_no_valid_rows_keeps_current_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store_dir = Path(directory) / "store"
+            source, invalid, empty = (
+                Path(directory) / name for name in ("ok.csv", "bad.csv", "empty.csv")
+            )
+            source.write_text(
+                "user,date,transaction_type,amount\n" "a,2021-01-01,CREDIT,10\n"
+            )
+            invalid.write_text(
+                "user,date,transaction_type,amount\n" "a,not-a-date,CREDIT,10\n"
+            )
+            empty.write_text("")
+            build_store(source, store_dir)
+            current = read_current(store_dir)
+            for path in (invalid, empty):
+                with self.assertRaises(CommandError):
+                    call_command(
+                        "build_transaction_store",
+                        source=str(path),
+                        output=str(store_dir),
+                        stdout=io.StringIO(),
+                    )
+            self.assertEqual(read_current(store_dir), current)
+
+
+class TransactionIngestTests(TestCase):
+    def test_appends_new_files_only(self):
+        with tempfile.TemporaryDirectory() as directory:
+            first, second = Path(directory) / "day1.csv", Path(directory) / "day2.csv"
+            first.write_text(
+                "user,date,transaction_type,amount\n"
+                "a,2021-01-01,CREDIT,1000\n"
+                "a,2021-01-02,DEBIT,250.50\n"
+                "b,not-a-date,CREDIT,5\n"
+            )
+            second.write_text(
+                "user,date,transaction_type,amount\n"
+                "a,2021-01-03,CREDIT,100\n"
+                "b,2021-01-03,REFUND,5\n"
+            )
+
+            results = ingest_files([first])
+            self.assertEqual(results[str(first)], {"rows": 2, "invalid": 1})
+            results = ingest_files([first, second])
+            self.assertIsNone(results[str(first)])
+            self.assertEqual(results[str(second)], {"rows": 1, "invalid": 1})
+
+            self.assertEqual(
+                list(UserBalance.objects.values_list("aadhar_id", "balance")),
+                [("a", Decimal("849.50"))],
+            )
+            self.assertEqual(TransactionFile.objects.count(), 2)
+
+            # Rebuilding re-reads both files instead of adding to the totals
+            ingest_files([second], rebuild=True)
+            self.assertEqual(
+                UserBalance.objects.get(aadhar_id="a").transaction_count, 3
+            )
+
+    def test_relative_and_absolute_paths_are_one_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "transactions.csv"
+            path.write_text(
+                "user,date,transaction_type,amount\n" "a,2021-01-01,CREDIT,500000\n"
+            )
+            ingest_files([os.path.relpath(path)])
+            with override_settings(TRANSACTIONS_FILE=str(path)):
+                ensure_balance_index()
+            self.assertEqual(TransactionFile.objects.get().path, str(path.resolve()))
+            self.assertEqual(
+                UserBalance.objects.get(aadhar_id="a").balance, Decimal("500000.00")
+            )
+
+    def test_balance_changes_queue_one_refresh(self):
+        cache.clear()
+        user = User.objects.create(
+            aadhar_id="a", name="A", email_id="a@example.com", annual_income=600000
+        )
+        with tempfile.TemporaryDirectory() as directory, mock.patch(
+            "loans.tasks.refresh_credit_scores.apply_async"
+        ) as apply_async:
+            paths = [Path(directory) / f"day{day}.csv" for day in (1, 2, 3)]
+            for day, path in enumerate(paths, 1):
+                path.write_text(
+                    "user,date,transaction_type,amount\n"
+                    f"a,2021-01-0{day},CREDIT,250000\n"
+                )
+
+            # Two files within the window are one refresh
+            for path in paths[:2]:
+                with self.captureOnCommitCallbacks(execute=True):
+                    ingest_files([path])
+            apply_async.assert_called_once_with((["a"],), countdown=60)
+
+            with mock.patch("loans.tasks.ensure_balance_index"):
+                refresh_credit_scores(["a"])
+            user.refresh_from_db()
+            self.assertEqual(user.credit_score, 560)
+
+            # Once refreshed, the next change queues another
+            with self.captureOnCommitCallbacks(execute=True):
+                ingest_files([paths[2]])
+            self.assertEqual(apply_async.call_count, 2)
+
+
+class PaymentImportTests(LoanFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.api_loan, self.imported_loan = self.client.post(
+            "/api/apply-loans/",
+            [self.application, self.application],
+            content_type="application/json",
+        ).json()
+
+    def loan_state(self, loan_id):
+        return (
+            list(
+                Installment.objects.filter(loan__loan_id=loan_id).values_list(
+                    "due_date", "amount_due", "paid"
+                )
+            ),
+            list(
+                Payment.objects.filter(loan__loan_id=loan_id)
+                .order_by("date")
+                .values_list("date", "amount", "principal", "interest")
+            ),
+            LoanStatement.objects.filter(loan__loan_id=loan_id).values(
+                "remaining_principal", "last_payment_date", "payment_count"
+            )[0],
+        )
+
+    def test_matches_make_payment(self):
+        dates = [emi["date"] for emi in self.api_loan["due_dates"]]
+        # Short, exact and over-payments, which carry forward differently
+        payments = [(dates[0], "20000"), (dates[1], "30000"), (dates[2], "50000")]
+        for payment_date, amount in payments:
+            response = self.client.post(
+                "/api/make-payment/",
+                {
+                    "loan": self.api_loan["loan_id"],
+                    "date": payment_date,
+                    "amount": amount,
+                },
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 200)
+
+        loan_id = self.imported_loan["loan_id"]
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "settlement.csv"
+            rejects = Path(directory) / "rejects.csv"
+            # Out of order, plus a duplicate, a skipped EMI, an unknown loan
+            # and an unreadable row
+            path.write_text(
+                "loan_id,date,amount\n"
+                f"{loan_id},{dates[2]},50000\n"
+                f"{loan_id},{dates[0]},20000\n"
+                f"{loan_id},{dates[1]},30000\n"
+                f"{loan_id},{dates[1]},30000\n"
+                f"{loan_id},{dates[4]},30000\n"
+                f"00000000-0000-4000-8000-000000000000,{dates[0]},100\n"
+                f"{loan_id},yesterday,100\n"
+            )
+            progress = mock.Mock()
+            chunks = []
+            imported = payment_import.import_loan_payments
+
+            def import_loan_payments(loan_payments, reject):
+                chunks.append(list(loan_payments))
+                return imported(loan_payments, reject)
+
+            with mock.patch.object(
+                payment_import, "import_loan_payments", import_loan_payments
+            ):
+                counts = import_settlement(
+                    path, rejects, chunk_size=1, progress=progress
+                )
+            self.assertEqual(counts, {"rows": 7, "imported": 3, "rejected": 4})
+            # One loan per transaction, flushed as the file is read
+            self.assertEqual(
+                chunks,
+                [
+                    [uuid.UUID(loan_id)],
+                    [uuid.UUID("00000000-0000-4000-8000-000000000000")],
+                ],
+            )
+            self.assertEqual(
+                progress.call_args_list, [mock.call(1, 5), mock.call(2, 7)]
+            )
+            reasons = sorted(
+                row["reason"]
+                for row in csv.DictReader(rejects.read_text().splitlines())
+            )
+            self.assertEqual(
+                reasons,
+                [
+                    "A payment for this loan on this date already exists",
+                    "Invalid loan ID",
+                    "Previous EMIs are due",
+                    "Unreadable loan_id, date or amount",
+                ],
+            )
+
+        self.assertEqual(
+            self.loan_state(loan_id), self.loan_state(self.api_loan["loan_id"])
+        )
+
+
+class LoanOfferTests(LoanFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f"/api/users/{self.user.unique_user_id}/offer/"
+
+    def test_offers_match_apply_loan(self):
+        for interest_rate in (14, 18.5):
+            quote = self.client.get(self.url, {"interest_rate": interest_rate}).json()
+            self.assertTrue(quote["offers"])
+
+            # The quoted bounds are accepted and one paisa outside is not
+            applications = [
+                {
+                    "user": str(self.user.unique_user_id),
+                    "loan_type": offer["loan_type"],
+                    "loan_amount": str(Decimal(str(amount)) + nudge),
+                    "interest_rate": interest_rate,
+                    "term_period": offer["term_period"],
+                    "disbursement_date": str(date.today() + timedelta(days=10)),
+                }
+                for offer in quote["offers"]
+                for amount, nudge in (
+                    (offer["min_amount"], 0),
+                    (offer["max_amount"], 0),
+                    (offer["min_amount"], Decimal("-0.01")),
+                    (offer["max_amount"], Decimal("0.01")),
+                )
+            ]
+            results = self.client.post(
+                "/api/apply-loans/", applications, content_type="application/json"
+            ).json()
+            for index, result in enumerate(results):
+                self.assertEqual(
+                    result["error"] is None, index % 4 < 2, applications[index]
+                )
+
+    def test_cached_until_score_changes(self):
+        with self.assertNumQueries(1):
+            quote = self.client.get(self.url).json()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).json(), quote)
+
+        with mock.patch("loans.tasks.balance_cache.get_many", return_value={}):
+            with self.captureOnCommitCallbacks(execute=True):
+                calculate_credit_scores([self.user.aadhar_id])
+        quote = self.client.get(self.url).json()
+        self.assertEqual(quote["credit_score"], 300)
+        self.assertEqual(quote["offers"], [])
+
+    def test_quote_made_before_score_change_is_not_served(self):
+        quote_offers = offers.quote_offers
+
+        def quote_then_rescore(user):
+            # The new score commits after the user is read but before the
+            # quote is cached
+            quote = quote_offers(user)
+            with mock.patch("loans.tasks.balance_cache.get_many", return_value={}):
+                with self.captureOnCommitCallbacks(execute=True):
+                    calculate_credit_scores([self.user.aadhar_id])
+            return quote
+
+        with mock.patch("loans.offers.quote_offers", quote_then_rescore):
+            self.assertEqual(self.client.get(self.url).json()["credit_score"], 700)
+        self.assertEqual(self.client.get(self.url).json()["credit_score"], 300)
+
+    def test_unknown_user(self):
+        response = self.client.get(
+            "/api/users/00000000-0000-4000-8000-000000000000/offer/"
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {"interest_rate": 10})
+        self.assertEqual(response.status_code, 400)
+
+    def test_term_period_bounds(self):
+        quote = self.client.get(self.url, {"term_period": 480}).json()
+        self.assertEqual({offer["term_period"] for offer in quote["offers"]}, {480})
+        for term_period in (0, 481, 10**9):
+            response = self.client.get(self.url, {"term_period": term_period})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("term_period", response.json())
+
+        # A huge term is a field error before any EMI is computed
+        huge_term = {"loan_type": "Home", "term_period": 10**9}
+        response = self.post_loan(**huge_term)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("term_period", response.json())
+        [result] = self.client.post(
+            "/api/apply-loans/",
+            [{**self.application, **huge_term}],
+            content_type="application/json",
+        ).json()
+        self.assertIn("term_period", result["error"])
+
+
+class BalanceCacheTests(TestCase):
+    def test_counts_and_reloads_on_fingerprint_change(self):
+        UserBalance.objects.create(aadhar_id="a", balance=150000)
+        balance_cache = BalanceCache()
+        with mock.patch(
+            "loans.balance_cache.file_fingerprint", return_value="v1"
+        ), mock.patch("loans.balance_cache.ensure_balance_index"), mock.patch(
+            "loans.balance_cache.current_store", return_value=None
+        ):
+            balance_cache.load()
+            with self.assertNumQueries(0):
+                self.assertEqual(balance_cache.get("a"), Decimal("150000.00"))
+                self.assertIsNone(balance_cache.get("b"))
+
+            UserBalance.objects.filter(aadhar_id="a").update(balance=200000)
+            with mock.patch("loans.balance_cache.file_fingerprint", return_value="v2"):
+                self.assertEqual(balance_cache.get("a"), Decimal("200000.00"))
+
+        self.assertEqual(
+            balance_cache.stats(),
+            {"hits": 2, "misses": 1, "loads": 1, "reloads": 1, "users": 1},
+        )
+
+    def test_store_adds_appended_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source, appended = Path(directory) / "all.csv", Path(directory) / "day.csv"
+            source.write_text(
+                "user,date,transaction_type,amount\n"
+                "a,2021-01-01,CREDIT,1000.50\n"
+                "b,2021-01-01,CREDIT,300\n"
+            )
+            appended.write_text(
+                "user,date,transaction_type,amount\n"
+                "a,2021-01-02,DEBIT,0.25\n"
+                "c,2021-01-02,CREDIT,40\n"
+            )
+            with override_settings(
+                TRANSACTIONS_FILE=str(source),
+                TRANSACTION_STORE_DIR=str(Path(directory) / "store"),
+            ):
+                ingest_files([source, appended])
+                build_store()
+                balance_cache = BalanceCache()
+                self.assertEqual(
+                    balance_cache.get_many(["a", "b", "c", "d"]),
+                    {
+                        "a": Decimal("1000.25"),
+                        "b": Decimal("300.00"),
+                        "c": Decimal("40.00"),
+                    },
+                )
+                self.assertIsNotNone(balance_cache.store)
+                self.assertEqual(balance_cache.stats()["users"], 3)
+
+                # Reloads take the appended balances from the database, so
+                # the files are not read again
+                balance_cache.loaded_at = float("-inf")
+                with mock.patch(
+                    "pandas.read_csv", side_effect=AssertionError("CSV read on reload")
+                ):
+                    self.assertEqual(balance_cache.get("a"), Decimal("1000.25"))
+                self.assertEqual(balance_cache.stats()["reloads"], 1)
+
+
+class AsyncViewTests(LoanFixtureMixin, TestCase):
+    """The /api/async/ views answer like their sync counterparts."""
+
+    def setUp(self):
+        super().setUp()
+        self.loan = self.apply_loan()
+        self.client.post(
+            "/api/make-payment/",
+            {
+                "loan": self.loan["loan_id"],
+                "date": self.loan["due_dates"][0]["date"],
+                "amount": 20000,
+            },
+            content_type="application/json",
+        )
+        self.statement = self.client.get(f"/api/get-statement/{self.loan['loan_id']}/")
+        cache.clear()
+
+    async def test_get_statement(self):
+        url = f"/api/async/get-statement/{self.loan['loan_id']}/"
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), self.statement.json())
+        self.assertEqual(response["ETag"], self.statement["ETag"])
+
+        not_modified = await self.async_client.get(
+            url, headers={"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+        stream = await self.async_client.get(url, {"stream": "ndjson"})
+        lines = [line async for line in stream.streaming_content]
+        self.assertEqual(len(lines), 20)
+
+    async def test_make_payment(self):
+        payment = {
+            "loan": self.loan["loan_id"],
+            "date": self.loan["due_dates"][1]["date"],
+            "amount": 40000,
+        }
+        response = await self.async_client.post(
+            "/api/async/make-payment/",
+            payment,
+            content_type="application/json",
+            headers={"Idempotency-Key": "retry-1"},
+        )
+        self.assertEqual(response.status_code, 200)
+
+        retry = await self.async_client.post(
+            "/api/async/make-payment/",
+            payment,
+            content_type="application/json",
+            headers={"Idempotency-Key": "retry-1"},
+        )
+        self.assertEqual(retry.json(), response.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+
+        duplicate = await self.async_client.post(
+            "/api/async/make-payment/", payment, content_type="application/json"
+        )
+        self.assertEqual(duplicate.status_code, 400)
+
+    async def test_register_user(self):
+        with mock.patch("loans.async_views.calculate_credit_score.delay") as delay:
+            response = await self.async_client.post(
+                "/api/async/register-user/",
+                {
+                    "aadhar_id": "b7fa4071-5883-4ac6-830e-4bb5a4cd7826",
+                    "name": "Bob",
+                    "email_id": "bob@example.com",
+                    "annual_income": 700000,
+                },
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        delay.assert_called_once_with("b7fa4071-5883-4ac6-830e-4bb5a4cd7826")
+
+
+@override_settings(PERF_INSTRUMENTATION=True)
+class InstrumentationTests(LoanFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def test_server_timing_and_metrics(self):
+        response = self.post_loan()
+        timing = response["Server-Timing"]
+        self.assertIn('desc="4 queries"', timing)
+        self.assertIn("validate;dur=", timing)
+        self.assertIn("schedule;dur=", timing)
+
+        body = self.client.get("/metrics/").content.decode()
+        self.assertIn(
+            'loans_http_requests_total{endpoint="apply-loan",method="POST",'
+            'status="200"} 1',
+            body,
+        )
+        self.assertIn('loans_db_queries_total{endpoint="apply-loan"} 4', body)
+        self.assertIn(
+            'loans_http_request_duration_seconds_count{endpoint="apply-loan"} 1', body
+        )
+
+    async def test_async_view(self):
+        loan = await sync_to_async(self.apply_loan)()
+        response = await self.async_client.get(
+            f"/api/async/get-statement/{loan['loan_id']}/"
+        )
+        # Loan, payments and installments, run in sync_to_async threads
+        self.assertIn('desc="3 queries"', response["Server-Timing"])
+
+    def test_disabled(self):
+        with override_settings(PERF_INSTRUMENTATION=False):
+            client = Client()
+            response = client.get("/metrics/")
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("Server-Timing", response)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+class LoggingTests(TestCase):
+    def test_structured_formatter_appends_fields(self):
+        formatter = StructuredFormatter("%(message)s")
+        record = logging.makeLogRecord(
+            {"msg": "Scored %s", "args": ("user",), "users": 3, "path": "a b.csv"}
+        )
+        self.assertEqual(formatter.format(record), 'Scored user users=3 path="a b.csv"')
+
+    def test_queue_handler_writes_on_listener_thread(self):
+        target = ListHandler()
+        target.setFormatter(StructuredFormatter("%(levelname)s %(message)s"))
+        handler = QueueListenerHandler([target])
+        handler.addFilter(SampleDebugFilter(rate=0))
+        logger = logging.getLogger("loans.tests.queue")
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        try:
+            logger.debug("Sampled out")
+            logger.info("Kept", extra={"rows": 2})
+            handler.flush()
+            self.assertEqual(target.lines, ["INFO Kept rows=2"])
+            # The listener is started again after a flush
+            logger.warning("Again")
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        self.assertEqual(target.lines[1:], ["WARNING Again"])
+
+    def test_task_timing(self):
+        task = mock.Mock()
+        task.name = "loans.tasks.calculate_credit_score"
+        start_task_timer(task_id="abc", task=task)
+        with self.assertLogs("loans.tasks", logging.INFO) as logs:
+            log_task_timing(task_id="abc", task=task, state="SUCCESS")
+        record = logs.records[0]
+        self.assertEqual((record.task, record.state), (task.name, "SUCCESS"))
+        self.assertGreaterEqual(record.duration_ms, 0)
+
+
+class CeleryConfigTests(SimpleTestCase):
+    def test_queues_and_acks(self):
+        route = celery_app.amqp.router.route
+        for task, queue, acks_late in (
+            (calculate_credit_score, "scoring", False),
+            (refresh_credit_scores, "scoring", False),
+            (run_delinquency_batch, "batch", False),
+            (process_delinquency_chunk, "batch", True),
+        ):
+            self.assertEqual(route({}, task.name)["queue"].name, queue)
+            self.assertEqual(task.acks_late, acks_late)
+            self.assertTrue(task.ignore_result)
+        self.assertIsNone(celery_app.conf.result_backend)
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    def test_tuned_connection(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        name = str(Path(directory) / "db.sqlite3")
+        wrapper = DatabaseWrapper({**connection.settings_dict, "NAME": name})
+        statements = []
+        try:
+            with wrapper.execute_wrapper(
+                lambda execute, sql, params, many, context: (
+                    statements.append(sql) or execute(sql, params, many, context)
+                )
+            ):
+                with wrapper.cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode")
+                    self.assertEqual(cursor.fetchone(), ("wal",))
+                    cursor.execute("PRAGMA synchronous")
+                    self.assertEqual(cursor.fetchone(), (1,))  # NORMAL
+                wrapper._start_transaction_under_autocommit()
+                wrapper.rollback()
+        finally:
+            wrapper.close()
+        self.assertIn("BEGIN IMMEDIATE", statements)
+
+
+class InstallmentMigrationTests(TransactionTestCase):
+    """Migration 0005 moves each loan's emi_dates JSON into Installment rows."""
+
+    migrate_from = [("loans", "0004_userbalance_transactionfile")]
+    migrate_to = [("loans", "0005_installment")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def test_emi_dates_become_installments(self):
+        apps = self.migrate(self.migrate_from)
+        user = apps.get_model("loans", "User").objects.create(
+            aadhar_id="f5abc955-889d-4a17-87b9-45b362eb673b",
+            name="Alice",
+            email_id="alice@example.com",
+            annual_income=1200000,
+        )
+        loan = apps.get_model("loans", "LoanApplication").objects.create(
+            user=user,
+            loan_type="Car",
+            loan_amount=500000,
+            interest_rate=15,
+            term_period=3,
+            disbursement_date=date(2024, 1, 1),
+            # Settled EMIs were stored with amount_due 0
+            emi_dates=[
+                {"date": "2024-02-01", "amount_due": 170000.5},
+                {"date": "2024-03-01", "amount_due": 0},
+                {"date": "2024-04-01", "amount_due": 170000.456},
+            ],
+        )
+
+        apps = self.migrate(self.migrate_to)
+        installments = apps.get_model("loans", "Installment").objects.filter(
+            loan_id=loan.id
+        )
+        self.assertEqual(
+            list(installments.values_list("due_date", "amount_due", "paid")),
+            [
+                (date(2024, 2, 1), Decimal("170000.50"), False),
+                (date(2024, 4, 1), Decimal("170000.46"), False),
+            ],
+        )
+
+
+class DatabaseUrlTests(SimpleTestCase):
+    def load_settings(self, database_url):
+        with mock.patch.dict(os.environ, {"DATABASE_URL": database_url}):
+            return runpy.run_path(settings_module.__file__)
+
+    def test_schemes(self):
+        self.assertEqual(
+            self.load_settings("")["DATABASES"]["default"]["NAME"],
+            settings_module.BASE_DIR / "db.sqlite3",
+        )
+        self.assertEqual(
+            self.load_settings("sqlite:////tmp/loans.db")["DATABASES"]["default"][
+                "NAME"
+            ],
+            "/tmp/loans.db",
+        )
+        self.assertEqual(
+            self.load_settings("postgres://app@db:5432/loans")["DATABASES"]["default"][
+                "ENGINE"
+            ],
+            "django.db.backends.postgresql",
+        )
+        for database_url in (
+            "postgresql+psycopg://app@db/loans",
+            "mysql://app@db/loans",
+            "db.sqlite3",
+        ):
+            with self.assertRaises(ImproperlyConfigured):
+                self.load_settings(database_url)
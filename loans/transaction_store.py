@@ -0,0 +1,198 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .money import from_paise
+from .transactions import (
+    estimate_chunk_rows,
+    file_fingerprint,
+    normalise_path,
+    read_transaction_chunks,
+    validate_transactions,
+)
+
+logger = logging.getLogger(__name__)
+
+# transaction_type codes
+DEBIT = 0
+CREDIT = 1
+
+COLUMNS = ("date", "transaction_type", "amount")
+
+
+def build_store(source=None, store_dir=None):
+    """
+    Converts a transaction CSV into the columnar store: rows sorted by user
+    and date, one .npy file per column, plus the sorted user IDs and the
+    offset of each user's first row. Returns the number of rows written.
+    Raises ValueError if the file has no valid rows, leaving the current
+    store in place.
+    """
+    source = normalise_path(source or settings.TRANSACTIONS_FILE)
+    store_dir = Path(store_dir or settings.TRANSACTION_STORE_DIR)
+    fingerprint = file_fingerprint(source)
+
+    # The same row checks as ingest_file, so the store and UserBalance agree;
+    # each valid chunk is narrowed to its final column types as it is read
+    frames = []
+    invalid = 0
+    try:
+        chunk_rows = estimate_chunk_rows(source)
+    except pd.errors.EmptyDataError:
+        raise ValueError(f"{source} is empty")
+    with open(source, "rb") as handle:
+        chunks = read_transaction_chunks(handle, chunk_rows)
+        for chunk, dropped in validate_transactions(chunks):
+            invalid += dropped
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "user": chunk["user"],
+                        "date": pd.to_datetime(chunk["date"], format="%Y-%m-%d"),
+                        "transaction_type": np.where(
+                            chunk["transaction_type"] == "CREDIT", CREDIT, DEBIT
+                        ).astype(np.int8),
+                        "amount": np.rint(
+                            chunk["amount"].to_numpy(dtype=float) * 100
+                        ).astype(np.int64),
+                    }
+                )
+            )
+    transactions = pd.concat(frames, ignore_index=True)
+    if transactions.empty:
+        raise ValueError(f"{source} has no valid transactions ({invalid} invalid)")
+    transactions["user"] = transactions["user"].astype("category")
+    # Sorted categories make the codes follow the byte order of the IDs
+    transactions["user"] = transactions["user"].cat.reorder_categories(
+        sorted(transactions["user"].cat.categories), ordered=True
+    )
+    transactions = transactions.sort_values(["user", "date"], kind="stable")
+
+    codes = transactions["user"].cat.codes.to_numpy()
+    users = np.asarray(transactions["user"].cat.categories, dtype="S36")
+    offsets = np.searchsorted(codes, np.arange(len(users) + 1)).astype(np.int64)
+    columns = {
+        "users": users,
+        "offsets": offsets,
+        "date": transactions["date"].to_numpy(dtype="datetime64[D]"),
+        "transaction_type": transactions["transaction_type"].to_numpy(),
+        "amount": transactions["amount"].to_numpy(),
+    }
+
+    # Each build goes to its own directory and CURRENT is switched to it in
+    # one rename, so open stores never see a half-written version.
+    store_dir.mkdir(parents=True, exist_ok=True)
+    version = tempfile.mkdtemp(prefix="store-", dir=store_dir)
+    os.chmod(version, 0o755)
+    for name, values in columns.items():
+        np.save(os.path.join(version, f"{name}.npy"), values)
+    with open(os.path.join(version, "meta.json"), "w") as meta:
+        json.dump(
+            {"source": source, "fingerprint": fingerprint, "rows": len(transactions)},
+            meta,
+        )
+
+    pointer = store_dir / "CURRENT.tmp"
+    pointer.write_text(os.path.basename(version))
+    previous = read_current(store_dir)
+    os.replace(pointer, store_dir / "CURRENT")
+    # Processes that still map the old files keep reading them until they
+    # reopen; unlinking does not pull the pages from under them.
+    if previous:
+        shutil.rmtree(store_dir / previous, ignore_errors=True)
+    logger.info(
+        "Built transaction store",
+        extra={"path": source, "rows": len(transactions), "invalid": invalid},
+    )
+    return len(transactions)
+
+
+def read_current(store_dir):
+    try:
+        return (Path(store_dir) / "CURRENT").read_text().strip()
+    except FileNotFoundError:
+        return None
+
+
+class TransactionStore:
+    """
+    Read-only view of one store version. Columns are memory-mapped, so the
+    pages are shared by every process that opens the same files and a user
+    lookup touches only that user's rows.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / "meta.json") as meta:
+            self.meta = json.load(meta)
+        self.users = np.load(self.path / "users.npy", mmap_mode="r")
+        self.offsets = np.load(self.path / "offsets.npy", mmap_mode="r")
+        self.columns = {
+            name: np.load(self.path / f"{name}.npy", mmap_mode="r") for name in COLUMNS
+        }
+
+    @property
+    def fingerprint(self):
+        return self.meta["fingerprint"]
+
+    def user_rows(self, aadhar_id):
+        # (start, stop) of the user's contiguous rows, or None if absent
+        key = aadhar_id.encode()
+        index = int(np.searchsorted(self.users, key))
+        if index == len(self.users) or self.users[index] != key:
+            return None
+        return int(self.offsets[index]), int(self.offsets[index + 1])
+
+    def balance(self, aadhar_id):
+        # Net balance (credits minus debits) in rupees, None if no history
+        rows = self.user_rows(aadhar_id)
+        if rows is None:
+            return None
+        start, stop = rows
+        amounts = self.columns["amount"][start:stop]
+        credits = self.columns["transaction_type"][start:stop] == CREDIT
+        return from_paise(int(amounts[credits].sum() - amounts[~credits].sum()))
+
+    def balances(self, aadhar_ids):
+        balances = {}
+        for aadhar_id in aadhar_ids:
+            balance = self.balance(aadhar_id)
+            if balance is not None:
+                balances[aadhar_id] = balance
+        return balances
+
+
+_open_store = None
+
+
+def get_store(store_dir=None):
+    """
+    The current store version for this process, reopened when a new build
+    is switched in. None when no store has been built.
+    """
+    global _open_store
+    store_dir = Path(store_dir or settings.TRANSACTION_STORE_DIR)
+    current = read_current(store_dir)
+    if current is None:
+        return None
+    if _open_store is None or _open_store.path != store_dir / current:
+        _open_store = TransactionStore(store_dir / current)
+    return _open_store
+
+
+def current_store():
+    # The store, if it was built from the current TRANSACTIONS_FILE
+    store = get_store()
+    source = normalise_path(settings.TRANSACTIONS_FILE)
+    if store is None or store.meta["source"] != source:
+        return None
+    if store.fingerprint != file_fingerprint(source):
+        return None
+    return store
@@ -0,0 +1,241 @@
+import logging
+import os
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+from django.dispatch import Signal
+
+from .models import TransactionFile, TransactionFileBalance, UserBalance
+from .money import from_paise, to_paise
+
+logger = logging.getLogger(__name__)
+
+# Sent once ingested rows are committed, with the aadhar_ids whose balance
+# changed, so their credit scores can be refreshed
+balances_changed = Signal()
+
+
+def normalise_path(path):
+    # TransactionFile rows are keyed by absolute path, so that a file named
+    # relative to another directory is still recognised as ingested
+    return str(Path(path).resolve())
+
+
+def file_fingerprint(path):
+    # Size and mtime are enough to notice a replaced or rewritten file without
+    # hashing its full contents on every task.
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def compute_balances(transactions):
+    # Sign amounts in a single vectorised pass: credits add, everything else
+    # (debits) subtracts.
+    signed = transactions["amount"].where(
+        transactions["transaction_type"] == "CREDIT", -transactions["amount"]
+    )
+    grouped = signed.groupby(transactions["user"], sort=False)
+    return pd.DataFrame({"balance": grouped.sum(), "transaction_count": grouped.size()})
+
+
+TRANSACTION_COLUMNS = ["user", "date", "transaction_type", "amount"]
+TRANSACTION_TYPES = ("CREDIT", "DEBIT")
+
+
+def estimate_chunk_rows(path, max_memory_mb=None):
+    # Rows per chunk that keep a chunk and its working copies under the
+    # memory ceiling, from the in-memory size of a sample of the file.
+    max_memory_mb = max_memory_mb or settings.TRANSACTION_INGEST_MAX_MEMORY_MB
+    sample = pd.read_csv(path, usecols=TRANSACTION_COLUMNS, dtype=str, nrows=1000)
+    bytes_per_row = max(sample.memory_usage(deep=True).sum() / max(len(sample), 1), 1)
+    # Validation and aggregation hold about four copies of a chunk at once
+    return max(int(max_memory_mb * 1024 * 1024 / (bytes_per_row * 4)), 1000)
+
+
+def read_transaction_chunks(handle, chunk_rows):
+    yield from pd.read_csv(
+        handle, usecols=TRANSACTION_COLUMNS, dtype=str, chunksize=chunk_rows
+    )
+
+
+def validate_transactions(chunks):
+    # Yields (valid rows with numeric amounts, number of rows dropped)
+    for chunk in chunks:
+        amounts = pd.to_numeric(chunk["amount"], errors="coerce")
+        dates = pd.to_datetime(chunk["date"], format="%Y-%m-%d", errors="coerce")
+        valid = (
+            chunk["user"].notna()
+            & (chunk["user"].str.len() <= 36)
+            & chunk["transaction_type"].isin(TRANSACTION_TYPES)
+            & np.isfinite(amounts)
+            & (amounts >= 0)
+            & dates.notna()
+        )
+        yield chunk.loc[valid].assign(amount=amounts[valid]), int((~valid).sum())
+
+
+def apply_balance_deltas(balances):
+    # Adds per-user deltas (compute_balances output) to UserBalance with one
+    # upsert per chunk; bulk_update's CASE expressions are far slower.
+    table = connection.ops.quote_name(UserBalance._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} (aadhar_id, balance, transaction_count) "
+            "VALUES (%s, %s, %s) ON CONFLICT (aadhar_id) DO UPDATE SET "
+            f"balance = {table}.balance + excluded.balance, "
+            f"transaction_count = {table}.transaction_count "
+            "+ excluded.transaction_count",
+            [
+                (user, from_paise(to_paise(balance)), int(transaction_count))
+                for user, balance, transaction_count in balances.itertuples()
+            ],
+        )
+
+
+def ingest_file(path, max_memory_mb=None, progress=None):
+    """
+    Streams one transaction file into UserBalance in chunks sized to the
+    memory ceiling, adding to the balances already there. The file is
+    recorded in TransactionFile in the same transaction, so a failed run
+    leaves nothing half-applied. progress, if given, is called after each
+    chunk with (bytes read, file size, rows so far).
+    """
+    path = normalise_path(path)
+    fingerprint = file_fingerprint(path)
+    size = os.path.getsize(path)
+    chunk_rows = estimate_chunk_rows(path, max_memory_mb)
+    rows = invalid = 0
+    # Net paise per user over the file, summed per chunk as UserBalance is
+    file_balances = Counter()
+
+    with transaction.atomic(), open(path, "rb") as handle:
+        for chunk, dropped in validate_transactions(
+            read_transaction_chunks(handle, chunk_rows)
+        ):
+            balances = compute_balances(chunk)
+            apply_balance_deltas(balances)
+            for aadhar_id, balance in balances["balance"].items():
+                file_balances[aadhar_id] += to_paise(balance)
+            rows += len(chunk)
+            invalid += dropped
+            if progress:
+                progress(handle.tell(), size, rows)
+
+        source, _ = TransactionFile.objects.update_or_create(
+            path=path, defaults={"fingerprint": fingerprint, "row_count": rows}
+        )
+        TransactionFileBalance.objects.bulk_create(
+            [
+                TransactionFileBalance(
+                    file=source, aadhar_id=aadhar_id, balance=from_paise(paise)
+                )
+                for aadhar_id, paise in file_balances.items()
+            ],
+            batch_size=1000,
+        )
+        changed = list(file_balances)
+        transaction.on_commit(
+            lambda: balances_changed.send(sender=None, aadhar_ids=changed)
+        )
+
+    logger.info(
+        "Ingested transactions",
+        extra={"path": path, "rows": rows, "invalid": invalid},
+    )
+    return {"rows": rows, "invalid": invalid}
+
+
+def ingest_files(paths, rebuild=False, max_memory_mb=None, progress=None):
+    """
+    Appends files that have not been ingested yet and skips those already
+    ingested unchanged. A changed file cannot be re-applied on top of its
+    old rows, so it needs rebuild, which clears the index and re-reads
+    every file ingested so far as well as the given ones.
+    """
+    paths = [normalise_path(path) for path in paths]
+    ingested = dict(TransactionFile.objects.values_list("path", "fingerprint"))
+    results = {}
+
+    with transaction.atomic():
+        if rebuild:
+            paths += [
+                path for path in ingested if path not in paths and os.path.exists(path)
+            ]
+            UserBalance.objects.all().delete()
+            TransactionFile.objects.all().delete()
+            ingested = {}
+
+        for path in paths:
+            if path in ingested:
+                if ingested[path] != file_fingerprint(path):
+                    raise ValueError(f"{path} changed since it was ingested")
+                results[path] = None
+                continue
+            results[path] = ingest_file(
+                path,
+                max_memory_mb,
+                progress and (lambda *args, path=path: progress(path, *args)),
+            )
+    return results
+
+
+def rebuild_balance_index(path=None):
+    path = normalise_path(path or settings.TRANSACTIONS_FILE)
+    logger.info("Rebuilding balance index", extra={"path": path})
+    ingest_files([path], rebuild=True)
+
+
+def ensure_balance_index(path=None):
+    path = normalise_path(path or settings.TRANSACTIONS_FILE)
+    fingerprint = file_fingerprint(path)
+    if TransactionFile.objects.filter(path=path, fingerprint=fingerprint).exists():
+        return
+
+    with transaction.atomic():
+        # Lock the source row and re-check so that a burst of tasks hitting a
+        # stale index rebuilds it once instead of once per task.
+        source, _ = TransactionFile.objects.get_or_create(
+            path=path, defaults={"fingerprint": ""}
+        )
+        source = TransactionFile.objects.select_for_update().get(pk=source.pk)
+        if source.fingerprint != fingerprint:
+            rebuild_balance_index(path)
+
+
+def get_user_balance(aadhar_id):
+    # Returns None when the user has no transactions at all.
+    return (
+        UserBalance.objects.filter(aadhar_id=aadhar_id)
+        .values_list("balance", flat=True)
+        .first()
+    )
+
+
+def credit_score_for_balance(total_balance):
+    if total_balance >= 1000000:
+        return 900
+    elif total_balance <= 100000:
+        return 300
+    return int(300 + ((total_balance - 100000) // 15000) * 10)
+
+
+def get_user_balances(aadhar_ids):
+    return dict(
+        UserBalance.objects.filter(aadhar_id__in=aadhar_ids).values_list(
+            "aadhar_id", "balance"
+        )
+    )
+
+
+def credit_scores_for_balances(balances):
+    # Vectorised form of credit_score_for_balance for batches of users.
+    balances = np.asarray(balances, dtype=float)
+    return np.where(
+        balances >= 1000000,
+        900,
+        np.where(balances <= 100000, 300, 300 + ((balances - 100000) // 15000) * 10),
+    ).astype(int)
@@ -1,13 +1,58 @@
 from django.urls import path
-from .views import RegisterUser, ApplyLoan, MakePayment, GetStatement
+from . import async_views
+from .views import (
+    RegisterUser,
+    RegisterUsers,
+    ApplyLoan,
+    ApplyLoans,
+    MakePayment,
+    GetStatement,
+    LoanOffers,
+    PortfolioCashflow,
+    prometheus_metrics,
+)
 
 urlpatterns = [
     path("api/register-user/", RegisterUser.as_view(), name="register-user"),
+    path("api/register-users/", RegisterUsers.as_view(), name="register-users"),
     path("api/apply-loan/", ApplyLoan.as_view(), name="apply-loan"),
+    path("api/apply-loans/", ApplyLoans.as_view(), name="apply-loans"),
     path("api/make-payment/", MakePayment.as_view(), name="make-payment"),
     path(
         "api/get-statement/<uuid:loan_id>/",
         GetStatement.as_view(),
         name="get-statement",
     ),
+    path(
+        "api/users/<uuid:user_id>/offer/",
+        LoanOffers.as_view(),
+        name="loan-offers",
+    ),
+    path(
+        "api/portfolio/cashflow/",
+        PortfolioCashflow.as_view(),
+        name="portfolio-cashflow",
+    ),
+    path("metrics/", prometheus_metrics, name="metrics"),
+    # Async variants for ASGI deployments, same request and response bodies
+    path(
+        "api/async/register-user/",
+        async_views.RegisterUser.as_view(),
+        name="async-register-user",
+    ),
+    path(
+        "api/async/make-payment/",
+        async_views.MakePayment.as_view(),
+        name="async-make-payment",
+    ),
+    path(
+        "api/async/get-statement/<uuid:loan_id>/",
+        async_views.GetStatement.as_view(),
+        name="async-get-statement",
+    ),
+    path(
+        "api/async/portfolio/cashflow/",
+        async_views.PortfolioCashflow.as_view(),
+        name="async-portfolio-cashflow",
+    ),
 ]
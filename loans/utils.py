@@ -1,109 +1,155 @@
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
+from bisect import bisect_left
+from datetime import date, datetime
+import numpy as np
+
+from .instrumentation import timed
+from .money import (
+    balance_after_term,
+    emi_paise,
+    from_paise,
+    rate_factors,
+    to_paise,
+)
 
 
 def calculate_emi(loan_amount, interest_rate, term_period, disbursement_date):
-    monthly_interest_rate = interest_rate / (12 * 100)
-    emi_amount = (
-        loan_amount
-        * monthly_interest_rate
-        * ((1 + monthly_interest_rate) ** term_period)
-        / (((1 + monthly_interest_rate) ** term_period) - 1)
+    [(emi_amount, emi_dates)] = calculate_emi_schedules(
+        [loan_amount], [interest_rate], [term_period], [disbursement_date]
     )
+    return emi_amount, emi_dates
 
-    emi_dates = []
-    remaining_principal = loan_amount
-
-    for i in range(term_period):
-        # Calculate interest for the current month
-        interest_for_month = remaining_principal * monthly_interest_rate
-        principal_for_month = emi_amount - interest_for_month
-
-        # Reduce remaining principal
-        remaining_principal -= principal_for_month
 
-        # Calculate EMI due date
-        emi_date = (disbursement_date + relativedelta(months=i + 1)).replace(day=1)
-        emi_dates.append(
-            {
-                "date": emi_date.strftime("%Y-%m-%d"),
-                "amount_due": round(emi_amount, 2),
+@timed("schedule")
+def calculate_emi_schedules(
+    loan_amounts, interest_rates, term_periods, disbursement_dates
+):
+    """
+    Computes the EMI and schedule for many loans in one call. Returns a list of
+    (emi_amount, emi_dates) tuples, one per loan, identical to what
+    calculate_emi returns for each loan individually. Amounts are Decimals
+    computed in integer paise from the cached annuity factors of each
+    (rate, term) pair, so no per-month stepping is needed.
+    """
+    term_periods = np.asarray(term_periods, dtype=np.int64)
+
+    emi_amounts = []
+    remaining_principal = []
+    for loan_amount, interest_rate, term_period in zip(
+        loan_amounts, interest_rates, term_periods.tolist()
+    ):
+        factors = rate_factors(interest_rate, term_period)
+        principal = to_paise(loan_amount)
+        emi = emi_paise(principal, factors)
+        emi_amounts.append(emi)
+        remaining_principal.append(balance_after_term(principal, emi, factors))
+
+    # EMI due dates are the first of each month following disbursement
+    first_months = np.array(
+        [np.datetime64(date, "M") for date in disbursement_dates],
+        dtype="datetime64[M]",
+    ).reshape(-1)
+    offsets = np.arange(1, int(term_periods.sum()) + 1) - np.repeat(
+        np.cumsum(term_periods) - term_periods, term_periods
+    )
+    due_dates = np.datetime_as_string(
+        (np.repeat(first_months, term_periods) + offsets).astype("datetime64[D]")
+    ).tolist()
+
+    schedules = []
+    start = 0
+    for emi, term_period, remainder in zip(
+        emi_amounts, term_periods.tolist(), remaining_principal
+    ):
+        amount_due = from_paise(emi)
+        emi_dates = [
+            {"date": date, "amount_due": amount_due}
+            for date in due_dates[start : start + term_period]
+        ]
+        start += term_period
+
+        # The last EMI settles what the rounded EMIs leave over or overpay
+        if remainder:
+            emi_dates[-1] = {
+                "date": emi_dates[-1]["date"],
+                "amount_due": from_paise(emi + remainder),
             }
-        )
-
-    # Adjust the last EMI
-    if remaining_principal > 0:
-        last_emi_date = (disbursement_date + relativedelta(months=term_period)).replace(
-            day=1
-        )
-        emi_dates[-1] = {
-            "date": last_emi_date.strftime("%Y-%m-%d"),
-            "amount_due": round(
-                remaining_principal + (emi_dates[-1]["amount_due"] - emi_amount), 2
-            ),
-        }
+        schedules.append((amount_due, emi_dates))
 
-    return emi_amount, emi_dates
+    return schedules
 
 
-def payment_handler(emi_dates, payment_date, payment_amount, max_emi):
+def apply_payment(installments, payment_date, payment_amount, max_emi):
+    """
+    Applies a payment to a loan's unpaid installments due on or after
+    payment_date, given as a date-sorted iterable of (key, due_date,
+    amount_due). The iterable is consumed only as far as the payment or the
+    shortfall carry-forward reaches. Returns {key: new_amount_due} for the
+    installments that change; an amount of 0 means the installment is paid.
+    """
+    delta = {}
     remaining_payment = payment_amount
-    new_emi_dates = []
-
-    # Apply payment to the current EMI
-    for emi in emi_dates:
-        if emi["date"] == str(payment_date):
-            if remaining_payment >= emi["amount_due"]:
-                remaining_payment -= emi["amount_due"]
-                emi["amount_due"] = 0
+    last = None
+
+    for key, due_date, amount_due in installments:
+        if due_date == payment_date:
+            # Apply payment to the current EMI. Any excess or shortfall is
+            # carried forward to the following EMIs.
+            remaining_payment -= amount_due
+            delta[key] = 0
+            continue
+        if remaining_payment == 0:
+            break
+        last = key
+
+        if remaining_payment > 0:
+            # Remaining positive payment, subtract from next month
+            if remaining_payment > amount_due:
+                remaining_payment -= amount_due
+                delta[key] = 0
             else:
-                remaining_due = emi["amount_due"] - remaining_payment
-                emi["amount_due"] = 0
-                remaining_payment = (
-                    -remaining_due
-                )  # Set to negative to indicate remaining due
-            new_emi_dates.append(emi)
+                delta[key] = amount_due - remaining_payment
+                remaining_payment = 0
         else:
-            new_emi_dates.append(emi)
-
-    # Remove the fully paid EMI from the list
-    new_emi_dates = [emi for emi in new_emi_dates if emi["amount_due"] != 0]
-
-    # Distribute remaining due amount to future EMIs, excluding the current month
-    for i in range(len(new_emi_dates)):
-        if new_emi_dates[i]["date"] > str(payment_date):
-            if remaining_payment == 0:
-                break
-            if remaining_payment > 0:
-                # Remaining positive payment, subtract from next month
-                if remaining_payment > new_emi_dates[i]["amount_due"]:
-                    remaining_payment -= new_emi_dates[i]["amount_due"]
-                    new_emi_dates[i]["amount_due"] = 0
-                else:
-                    new_emi_dates[i]["amount_due"] -= remaining_payment
-                    remaining_payment = 0
+            # Remaining negative payment, add to next month
+            remaining_due = -remaining_payment
+            if amount_due + remaining_due <= max_emi:
+                delta[key] = amount_due + remaining_due
+                remaining_payment = 0
             else:
-                # Remaining negative payment, add to next month
-                remaining_due = -remaining_payment
-                if new_emi_dates[i]["amount_due"] + remaining_due <= max_emi:
-                    new_emi_dates[i]["amount_due"] += remaining_due
-                    remaining_payment = 0
-                else:
-                    excess_amount = (
-                        new_emi_dates[i]["amount_due"] + remaining_due - max_emi
-                    )
-                    new_emi_dates[i]["amount_due"] = max_emi
-                    remaining_payment = -excess_amount
-
-    # If there's still remaining due, add it to the last EMI
+                delta[key] = max_emi
+                remaining_payment = -(amount_due + remaining_due - max_emi)
+
+    # If there's still remaining due, add it to the last EMI. Without a later
+    # EMI the shortfall stays on the one being paid.
     if remaining_payment < 0:
-        last_emi = new_emi_dates[-1]
-        last_emi["amount_due"] += -remaining_payment
-        remaining_payment = 0
+        if last is None:
+            last = next(iter(delta))
+        delta[last] += -remaining_payment
+
+    return delta
+
+
+def payment_handler(emi_dates, payment_date, payment_amount, max_emi):
+    if isinstance(payment_date, datetime):
+        payment_date = payment_date.date()
+
+    # Only EMIs due on or after the payment date can change
+    due_dates = [date.fromisoformat(emi["date"]) for emi in emi_dates]
+    start = bisect_left(due_dates, payment_date)
+    delta = apply_payment(
+        (
+            (index, due_dates[index], emi_dates[index]["amount_due"])
+            for index in range(start, len(emi_dates))
+        ),
+        payment_date,
+        payment_amount,
+        max_emi,
+    )
 
-    # Ensure all EMIs are included and only fully paid EMIs are removed
     adjusted_emi_dates = []
-    for emi in new_emi_dates:
+    for index, emi in enumerate(emi_dates):
+        if index in delta:
+            emi = {"date": emi["date"], "amount_due": delta[index]}
         if emi["amount_due"] > 0:
             adjusted_emi_dates.append(emi)
 
@@ -1,11 +1,32 @@
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import User, LoanApplication, Payment
-from .serializers import UserSerializer, LoanApplicationSerializer, PaymentSerializer
-from .tasks import calculate_credit_score
+from .cashflow import portfolio_cashflow
+from .eligibility import MIN_INTEREST_RATE, evaluate_applications
+from .idempotency import idempotent
+from .instrumentation import metrics
+from .models import User, LoanApplication
+from .offers import get_offers, quote_offers
+from .serializers import (
+    UserSerializer,
+    BulkUserSerializer,
+    LoanApplicationSerializer,
+    OfferQuerySerializer,
+    PaymentSerializer,
+    StatementQuerySerializer,
+    create_loans,
+)
+from .statements import (
+    cache_statement,
+    get_cached_statement,
+    statement_page,
+    stream_statement,
+)
+from .tasks import calculate_credit_score, calculate_credit_scores
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from datetime import datetime
 
 
 class RegisterUser(APIView):
@@ -22,119 +43,218 @@ class RegisterUser(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class RegisterUsers(APIView):
+    def post(self, request):
+        serializer = BulkUserSerializer(data=request.data, many=True)
+        if serializer.is_valid():
+            users = serializer.save()
+
+            # Score in chunks so a large partner file is a handful of tasks
+            # instead of one broker round-trip per user
+            aadhar_ids = [user.aadhar_id for user in users]
+            batch_size = settings.CREDIT_SCORE_BATCH_SIZE
+            for start in range(0, len(aadhar_ids), batch_size):
+                calculate_credit_scores.delay(aadhar_ids[start : start + batch_size])
+
+            return Response(
+                [
+                    {"aadhar_id": user.aadhar_id, "unique_user_id": user.unique_user_id}
+                    for user in users
+                ],
+                status=status.HTTP_200_OK,
+            )
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
 class ApplyLoan(APIView):
     def post(self, request):
         serializer = LoanApplicationSerializer(data=request.data)
         if serializer.is_valid():
             user_id = serializer.validated_data["user"]
-            try:
-                user = User.objects.get(unique_user_id=user_id)
-                # Validate user's credit score and annual income
-                if user.credit_score < 450 or user.annual_income < 150000:
-                    return Response(
-                        {
-                            "error": "User does not meet the criteria for loan application"
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                loan_amount = serializer.validated_data["loan_amount"]
-                loan_type = serializer.validated_data["loan_type"]
-                interest_rate = serializer.validated_data["interest_rate"]
-
-                # Validate loan amount based on loan type
-                loan_limits = {
-                    "Car": 750000,
-                    "Home": 8500000,
-                    "Education": 5000000,
-                    "Personal": 1000000,
-                }
-                if loan_amount > loan_limits.get(loan_type, 0):
-                    return Response(
-                        {
-                            "error": "Loan amount exceeds the limit for the selected loan type"
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
+            users = User.objects.in_bulk([user_id], field_name="unique_user_id")
 
-                # Validate interest rate
-                if interest_rate < 14:
-                    return Response(
-                        {"error": "Interest rate should be >= 14%"},
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
+            # Credit score, income, loan limit, interest rate and EMI checks
+            [error], [schedule] = evaluate_applications(
+                [serializer.validated_data], users
+            )
+            if error:
+                return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
 
-                loan = serializer.save()
-                return Response(
-                    {
-                        "error": None,
-                        "loan_id": loan.loan_id,
-                        "due_dates": loan.emi_dates,
-                    },
-                    status=status.HTTP_200_OK,
-                )
-            except User.DoesNotExist:
-                return Response(
-                    {"error": "User does not exist"}, status=status.HTTP_400_BAD_REQUEST
-                )
+            loan = serializer.save(user=users[user_id], emi_dates=schedule[1])
+            return Response(
+                {
+                    "error": None,
+                    "loan_id": loan.loan_id,
+                    "due_dates": loan.emi_dates,
+                },
+                status=status.HTTP_200_OK,
+            )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ApplyLoans(APIView):
+    def post(self, request):
+        # Partner batches: every application gets its own result, in request
+        # order, and the accepted ones are inserted together
+        if not isinstance(request.data, list):
+            return Response(
+                {"error": "Expected a list of loan applications"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        max_size = settings.LOAN_APPLICATION_BATCH_MAX_SIZE
+        if len(request.data) > max_size:
+            return Response(
+                {"error": f"At most {max_size} loan applications per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = [None] * len(request.data)
+        valid = []
+        for index, item in enumerate(request.data):
+            serializer = LoanApplicationSerializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {"error": serializer.errors}
+
+        applications = [data for _, data in valid]
+        users = User.objects.in_bulk(
+            {data["user"] for data in applications}, field_name="unique_user_id"
+        )
+        errors, schedules = evaluate_applications(applications, users)
+
+        accepted = []
+        for (index, data), error, schedule in zip(valid, errors, schedules):
+            if error:
+                results[index] = {"error": error}
+            else:
+                accepted.append((index, data, schedule[1]))
+
+        with transaction.atomic():
+            loans = create_loans(
+                [
+                    (users[data["user"]], data, emi_dates)
+                    for _, data, emi_dates in accepted
+                ]
+            )
+        for (index, _, _), loan in zip(accepted, loans):
+            results[index] = {
+                "error": None,
+                "loan_id": loan.loan_id,
+                "due_dates": loan.emi_dates,
+            }
+        return Response(results, status=status.HTTP_200_OK)
+
+
 class MakePayment(APIView):
+    @idempotent
     def post(self, request):
         serializer = PaymentSerializer(data=request.data)
-        if serializer.is_valid():
-            payment = serializer.save()
+        try:
+            # Validation locks the loan row, so concurrent payments for the
+            # same loan are applied one after the other
+            with transaction.atomic():
+                if serializer.is_valid():
+                    payment = serializer.save()
+                    return Response(
+                        {"status": "Payment registered successfully"},
+                        status=status.HTTP_200_OK,
+                    )
+        except IntegrityError:
             return Response(
-                {"status": "Payment registered successfully"}, status=status.HTTP_200_OK
+                {
+                    "non_field_errors": [
+                        "A payment for this loan on this date already exists"
+                    ]
+                },
+                status=status.HTTP_400_BAD_REQUEST,
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class GetStatement(APIView):
     def get(self, request, loan_id):
-        try:
-            loan = LoanApplication.objects.get(loan_id=loan_id)
+        # Served from the statement cache; a matching If-None-Match is
+        # answered with 304 without touching the database.
+        query = StatementQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+
+        statement = None
+        if not params:
+            statement = get_cached_statement(loan_id)
+        if statement is None:
+            try:
+                loan = LoanApplication.objects.get(loan_id=loan_id)
+            except LoanApplication.DoesNotExist:
+                return Response(
+                    {"error": "Loan does not exist"}, status=status.HTTP_400_BAD_REQUEST
+                )
             if loan.is_closed:
                 return Response(
                     {"error": "Loan is closed"}, status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Calculate past transactions
-            past_transactions = []
-            payments = Payment.objects.filter(loan=loan).order_by("date")
-            remaining_principal = float(loan.loan_amount)
-            monthly_interest_rate = float(loan.interest_rate) / (12 * 100)
-            emi_amount = (
-                remaining_principal
-                * monthly_interest_rate
-                * ((1 + monthly_interest_rate) ** loan.term_period)
-                / (((1 + monthly_interest_rate) ** loan.term_period) - 1)
-            )
-            for payment in payments:
-                interest_for_month = remaining_principal * monthly_interest_rate
-                principal_for_month = emi_amount - interest_for_month
-                remaining_principal -= principal_for_month
-                past_transactions.append(
-                    {
-                        "date": payment.date.strftime("%Y-%m-%d"),
-                        "principal": round(principal_for_month, 2),
-                        "interest": round(interest_for_month, 2),
-                        "amount_paid": round(payment.amount, 2),
-                    }
+            # Long statements can be streamed as NDJSON or read page by page
+            if params.get("stream") == "ndjson":
+                return StreamingHttpResponse(
+                    stream_statement(loan), content_type="application/x-ndjson"
                 )
+            if params:
+                page = statement_page(
+                    loan,
+                    params.get("limit", settings.STATEMENT_PAGE_SIZE),
+                    params.get("past_after"),
+                    params.get("upcoming_after"),
+                    params.get("section"),
+                )
+                return Response(page, status=status.HTTP_200_OK)
 
-            # Calculate upcoming transactions
-            upcoming_transactions = loan.emi_dates
+            statement = cache_statement(loan)
 
-            return Response(
-                {
-                    "past_transactions": past_transactions,
-                    "upcoming_transactions": upcoming_transactions,
-                },
-                status=status.HTTP_200_OK,
+        if_none_match = request.headers.get("If-None-Match", "")
+        if statement["etag"] in [etag.strip() for etag in if_none_match.split(",")]:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(statement["body"], status=status.HTTP_200_OK)
+        response["ETag"] = statement["etag"]
+        return response
+
+
+class LoanOffers(APIView):
+    def get(self, request, user_id):
+        # Offers at the default rate and tenors come from the per-user quote
+        # cache; other rates and single tenors are quoted on the fly
+        query = OfferQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+
+        if not params:
+            quote = get_offers(user_id)
+        else:
+            user = User.objects.filter(unique_user_id=user_id).first()
+            quote = user and quote_offers(
+                user,
+                params.get("interest_rate", MIN_INTEREST_RATE),
+                [params["term_period"]] if "term_period" in params else None,
             )
-        except LoanApplication.DoesNotExist:
+        if quote is None:
             return Response(
-                {"error": "Loan does not exist"}, status=status.HTTP_400_BAD_REQUEST
+                {"error": "User does not exist"}, status=status.HTTP_400_BAD_REQUEST
             )
+        return Response(quote, status=status.HTTP_200_OK)
+
+
+class PortfolioCashflow(APIView):
+    def get(self, request):
+        # Expected collections by month and loan type over all open loans
+        return Response({"cashflow": portfolio_cashflow()}, status=status.HTTP_200_OK)
+
+
+def prometheus_metrics(request):
+    # Scrape target for this process's request metrics
+    if not settings.PERF_INSTRUMENTATION:
+        raise Http404
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4")